@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+import ledger_index
+
+# ===================== 增量余额计算 =====================
+# 每个账户维护一份按 (日期, 序号) 排序的带符号金额序列和累计余额。
+# 增删改某条记录时，只重算该账户从变动位置开始的后缀，
+# 而不是对整本账重新排序、逐行 apply 和 groupby cumsum。
+# 金额和余额都是以分为单位的整数，累加没有误差。
+# 每条记录处的累计余额就是该账户的余额检查点：按日期二分查找即可得到任意日期的余额，
+# 补记或修改较早日期的记录时只有变动位置之后的检查点需要重算。
+# 插入、删除会逐个替换序列的各个数组，修改和查询都在索引锁下进行，查询不会看到改了一半的序列。
+
+
+def signed_amounts(df):
+    """收入为正、支出为负的金额变动（向量化）"""
+    amounts = df['金额'].to_numpy(dtype='int64')
+    return pd.Series(np.where(df['类型'] == '收入', amounts, -amounts), index=df.index)
+
+
+def _date_key(date):
+    return pd.Timestamp(date).value
+
+
+def _day_end_key(date):
+    """date 当天结束（次日零点）的时间戳，用于“截至某日（含当天）”的查询"""
+    return (pd.Timestamp(date).normalize() + pd.Timedelta(days=1)).value
+
+
+class AccountSeries:
+    """单个账户按 (日期, 序号) 排序的记录序列"""
+
+    __slots__ = ("dates", "ids", "signed", "balance")
+
+    def __init__(self, dates, ids, signed, balance):
+        self.dates = dates      # int64 纳秒时间戳
+        self.ids = ids          # 序号
+        self.signed = signed    # 带符号金额（分）
+        self.balance = balance  # 累计余额（分）
+
+    def position(self, date, record_id):
+        """(日期, 序号) 在序列中的插入位置（二分查找）"""
+        lo = np.searchsorted(self.dates, date, side='left')
+        hi = np.searchsorted(self.dates, date, side='right')
+        return lo + np.searchsorted(self.ids[lo:hi], record_id)
+
+    def balance_as_of(self, day_end):
+        """day_end 之前最后一条记录处的余额（二分查找）"""
+        pos = np.searchsorted(self.dates, day_end, side='left')
+        if pos:
+            return int(self.balance[pos - 1])
+        # 第一条记录之前：完整账本为 0，只读取了部分账本时为期初余额
+        return int(self.balance[0] - self.signed[0]) if len(self.balance) else 0
+
+    def recompute_from(self, pos):
+        """从 pos 开始重算累计余额，返回受影响的 (序号, 余额)"""
+        start = self.balance[pos - 1] if pos > 0 else 0
+        self.balance[pos:] = start + np.cumsum(self.signed[pos:])
+        return self.ids[pos:], self.balance[pos:]
+
+
+class BalanceEngine:
+    """按账户维护余额序列，支持增量插入和删除"""
+
+    def __init__(self, df):
+        self.accounts = {}
+        if df.empty:
+            return
+        df = df.sort_values(by=['账户', '日期', '序号'], kind='stable')
+        signed = signed_amounts(df)
+        self._build(df, signed, signed.groupby(df['账户'], observed=True).cumsum())
+
+    @classmethod
+    def from_sorted(cls, df):
+        """由已按 (账户, 日期, 序号) 排好序且算好余额的 DataFrame 构建"""
+        engine = cls.__new__(cls)
+        engine.accounts = {}
+        if not df.empty:
+            engine._build(df, signed_amounts(df), df['余额'])
+        return engine
+
+    def _build(self, df, signed, balance):
+        dates = df['日期'].to_numpy(dtype='datetime64[ns]').view('int64')
+        ids = df['序号'].to_numpy(dtype='int64')
+        signed = signed.to_numpy(dtype='int64')
+        balance = balance.to_numpy(dtype='int64')
+        for account, pos in df.groupby('账户', sort=False, observed=True).indices.items():
+            self.accounts[account] = AccountSeries(
+                dates[pos].copy(), ids[pos].copy(), signed[pos].copy(), balance[pos].copy()
+            )
+
+    def insert(self, account, date, record_id, signed):
+        """插入一条记录，返回该账户受影响的 (序号, 余额)"""
+        date = _date_key(date)
+        with ledger_index.locked():
+            series = self.accounts.get(account)
+            if series is None:
+                series = AccountSeries(np.empty(0, 'int64'), np.empty(0, 'int64'),
+                                       np.empty(0, 'int64'), np.empty(0, 'int64'))
+                self.accounts[account] = series
+            pos = series.position(date, record_id)
+            series.dates = np.insert(series.dates, pos, date)
+            series.ids = np.insert(series.ids, pos, record_id)
+            series.signed = np.insert(series.signed, pos, signed)
+            series.balance = np.insert(series.balance, pos, 0)
+            return series.recompute_from(pos)
+
+    def balance_as_of(self, account, date=None):
+        """账户截至 date（含当天）的余额，date 为 None 时返回最新余额；单位为分"""
+        day_end = None if date is None else _day_end_key(date)
+        with ledger_index.locked():
+            series = self.accounts.get(account)
+            if series is None or len(series.balance) == 0:
+                return 0
+            if day_end is None:
+                return int(series.balance[-1])
+            return series.balance_as_of(day_end)
+
+    def balances_as_of(self, date=None):
+        """各账户截至 date（含当天）的余额：账户 -> 余额（分）"""
+        with ledger_index.locked():
+            return {account: self.balance_as_of(account, date) for account in self.accounts}
+
+    def remove(self, account, date, record_id):
+        """删除一条记录，返回该账户受影响的 (序号, 余额)"""
+        with ledger_index.locked():
+            series = self.accounts[account]
+            pos = series.position(_date_key(date), record_id)
+            series.dates = np.delete(series.dates, pos)
+            series.ids = np.delete(series.ids, pos)
+            series.signed = np.delete(series.signed, pos)
+            series.balance = np.delete(series.balance, pos)
+            if len(series.ids) == 0:
+                del self.accounts[account]
+                return series.ids, series.balance
+            return series.recompute_from(pos)
+
+
+def signed_amount(record):
+    """单条记录的带符号金额"""
+    return record['金额'] if record['类型'] == '收入' else -record['金额']
+
+
+def write_back(df, changes):
+    """把引擎返回的 (序号, 余额) 写回以序号为索引的 DataFrame"""
+    for ids, balances in changes:
+        if len(ids):
+            df.loc[ids, '余额'] = balances
+    return df
+
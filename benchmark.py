@@ -0,0 +1,267 @@
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# ===================== 性能基准测试 =====================
+# 用固定随机种子生成合成账本（1千 ~ 1千万行，账户/用途/标签按真实账本的偏态分布），
+# 在临时目录中对账本的读取、保存、增删改、余额计算、搜索和各统计视图计时。
+# 每种规模在独立子进程中运行，以便分别记录内存峰值；结果写成 JSON，便于不同提交之间对比。
+#
+# 用法:
+#   python benchmark.py                              # 默认 1千/1万/10万 行
+#   python benchmark.py --sizes 1000 1000000 10000000 -o bench.json
+#   python benchmark.py --compare old.json new.json  # 对比两次结果
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+ACCOUNTS = ["中行", "微信", "支付宝", "浦发", "建行"]
+ACCOUNT_WEIGHTS = [0.35, 0.30, 0.25, 0.05, 0.05]
+PURPOSES = ["吃饭", "饮", "零食", "交通", "网购", "购物", "月度", "娱乐", "请客", "住房", "医疗", "教育", "其他"]
+SOURCES = ["工资", "转账", "退款", "生活费", "理财", "退货"]
+NOTES = ["", "", "", "午餐", "晚餐", "早餐", "地铁", "打车", "超市", "外卖", "房租", "话费", "电费", "咖啡"]
+TAG_POOL = 200
+
+
+def _zipf_weights(n, s=1.1):
+    weights = 1 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+def synthetic_ledger(rows, seed=0, years=3):
+    """生成以元为单位的合成账本（存储格式，不含余额）"""
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp("2025-12-31")
+    days = rng.integers(0, 365 * years, rows)
+    is_income = rng.random(rows) < 0.15
+    expense = np.round(rng.lognormal(3.5, 1.0, rows), 2)
+    income = np.round(rng.lognormal(7.5, 0.8, rows), 2)
+
+    tag_names = np.array([f"标签{i}" for i in range(TAG_POOL)], dtype=object)
+    tag_weights = _zipf_weights(TAG_POOL)
+    first = tag_names[rng.choice(TAG_POOL, rows, p=tag_weights)]
+    second = tag_names[rng.choice(TAG_POOL, rows, p=tag_weights)]
+    tag_count = rng.choice(3, rows, p=[0.3, 0.5, 0.2])
+    tags = np.where(tag_count == 0, None, np.where(tag_count == 1, first, first + " " + second))
+
+    return pd.DataFrame({
+        "序号": np.arange(1, rows + 1),
+        "日期": end - pd.to_timedelta(days, unit="D"),
+        "类型": np.where(is_income, "收入", "支出"),
+        "账户": rng.choice(ACCOUNTS, rows, p=ACCOUNT_WEIGHTS),
+        "金额": np.where(is_income, income, expense),
+        "来源": np.where(is_income, rng.choice(SOURCES, rows), None),
+        "用途": np.where(is_income, None, rng.choice(PURPOSES, rows, p=_zipf_weights(len(PURPOSES)))),
+        "标签": np.where(is_income, None, tags),
+        "备注": rng.choice(NOTES, rows),
+    })
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def measure(fn, repeat):
+    """重复运行取最短耗时（秒）"""
+    return min(_timed(fn)[0] for _ in range(repeat))
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_size(rows, seed, repeat, mutations):
+    """在临时目录中对一种规模的账本计时（在子进程中调用）"""
+    os.chdir(tempfile.mkdtemp(prefix="jizhang_bench_"))
+    timings = {}
+    # 冷启动：导入应用模块、读取账本、算出各账户余额（首屏显示余额之前的全部工作）
+    timings["import_app"], fa = _timed(lambda: importlib.import_module("finance_app"))
+    import ledger_data
+    import ledger_journal
+    import ledger_schema
+    import storage
+
+    fa.get_storage().write_all(synthetic_ledger(rows, seed), seq=0)
+    first_load, df = _timed(fa.load_data)
+    timings["time_to_first_balance"] = timings["import_app"] + first_load + _timed(
+        lambda: fa.get_account_balances(df))[0]
+
+    def cold_load():
+        fa.get_ledger_cache.clear()
+        ledger_journal._journals.clear()
+        return fa.load_data()
+
+    timings["load_data_cold"] = measure(cold_load, repeat)
+    df = fa.load_data()
+    timings["load_data_warm"] = measure(fa.load_data, repeat)
+
+    # 搜索：首次调用构建倒排索引，之后只做查询
+    timings["search_index_build"], search_index = _timed(lambda: fa.get_search_index(df))
+    timings["search_query"] = measure(lambda: search_index.search("午餐 OR 超市"), repeat)
+    # 关键词筛选（与管理视图相同：查询索引并换算成账本中的行位置）
+    timings["search_mask"] = measure(lambda: fa.search_positions(df, "午餐 OR 超市"), repeat)
+
+    # 时间统计
+    timings["time_rollup_build"], rollup = _timed(lambda: fa.get_rollup(df))
+    timings["time_aggregate_month"] = measure(lambda: rollup.period_totals("ME"), repeat)
+
+    # 分类统计（与分类视图相同的计算）
+    timings["category_aggregate"] = measure(lambda: ledger_data.category_totals(df, "支出"), repeat)
+
+    # 标签统计
+    timings["tag_index_build"], tag_index = _timed(lambda: fa.get_tag_index(df))
+    timings["tag_aggregate"] = measure(lambda: tag_index.stats(), repeat)
+
+    # 增删改：每种操作执行多次取平均；后台落盘推迟到计时结束之后，保存单独计时
+    worker = fa.get_flush_worker()
+    worker.delay = worker.max_delay = 3600
+    rng = np.random.default_rng(seed + 1)
+    record = {"日期": pd.Timestamp("2025-06-01"), "类型": "支出", "账户": "微信", "金额": 1234,
+              "来源": None, "用途": "吃饭", "标签": "标签1", "备注": "基准测试"}
+    add_times, update_times, delete_times = [], [], []
+    for _ in range(mutations):
+        elapsed, df = _timed(lambda: fa.add_record(df, record))
+        add_times.append(elapsed)
+    for _ in range(mutations):
+        index = df.index[rng.integers(len(df))]
+        elapsed, df = _timed(lambda: fa.update_record(df, index, {"金额": int(rng.integers(1, 100000))}))
+        update_times.append(elapsed)
+    for _ in range(mutations):
+        index = df.index[rng.integers(len(df))]
+        elapsed, df = _timed(lambda: fa.delete_record(df, index))
+        delete_times.append(elapsed)
+    timings["add_record"] = statistics.mean(add_times)
+    timings["update_record"] = statistics.mean(update_times)
+    timings["delete_record"] = statistics.mean(delete_times)
+
+    # 保存会导出 Excel，超过工作表行数上限时跳过
+    if len(df) <= storage.EXCEL_MAX_ROWS:
+        timings["save_data"] = _timed(fa.save_data)[0]
+
+    # 全量余额计算放在最后：它会把派生索引重新绑定到新的 DataFrame 上
+    timings["calculate_balance"] = measure(lambda: fa.calculate_balance(df.copy()), repeat)
+
+    return {
+        "rows": rows,
+        "timings": {name: round(seconds, 6) for name, seconds in timings.items()},
+        "frame_mb": round(df.memory_usage(deep=True).sum() / 1024 / 1024, 2),
+        "frame_external_mb": round(ledger_schema.expand(df).memory_usage(deep=True).sum() / 1024 / 1024, 2),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(sizes, seed, repeat, mutations):
+    """每种规模启动一个子进程，汇总结果"""
+    results = []
+    here = os.path.dirname(os.path.abspath(__file__))
+    for rows in sizes:
+        print(f"运行 {rows:,} 行 ...", flush=True)
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            result_path = f.name
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")])))
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-one", str(rows), "--seed", str(seed),
+             "--repeat", str(repeat), "--mutations", str(mutations), "--result-file", result_path],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        if proc.returncode != 0:
+            print(proc.stderr[-2000:], file=sys.stderr)
+            results.append({"rows": rows, "error": f"子进程退出码 {proc.returncode}"})
+        else:
+            with open(result_path, encoding="utf-8") as f:
+                results.append(json.load(f))
+        os.remove(result_path)
+    return {
+        "commit": _git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def print_report(report):
+    for result in report["results"]:
+        if "error" in result:
+            print(f"\n{result['rows']:,} 行: {result['error']}")
+            continue
+        print(f"\n{result['rows']:,} 行  内存 {result['frame_mb']} MB（外部格式 {result['frame_external_mb']} MB）"
+              f"  峰值 RSS {result['peak_rss_mb']} MB")
+        for name, seconds in result["timings"].items():
+            print(f"  {name:<22}{seconds * 1000:>12.2f} ms")
+
+
+def compare(old_path, new_path):
+    """逐项对比两次结果，比值 >1 表示变慢"""
+    with open(old_path, encoding="utf-8") as f:
+        old = {r["rows"]: r for r in json.load(f)["results"] if "timings" in r}
+    with open(new_path, encoding="utf-8") as f:
+        new = {r["rows"]: r for r in json.load(f)["results"] if "timings" in r}
+    for rows in sorted(old.keys() & new.keys()):
+        print(f"\n{rows:,} 行")
+        for name, seconds in new[rows]["timings"].items():
+            before = old[rows]["timings"].get(name)
+            if before:
+                ratio = seconds / before
+                flag = "  <-- 变慢" if ratio > 1.2 else ""
+                print(f"  {name:<22}{before * 1000:>10.2f} -> {seconds * 1000:>10.2f} ms  x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="账本性能基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="账本行数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数（取最短）")
+    parser.add_argument("--mutations", type=int, default=20, help="增删改各执行的次数")
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--run-one", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.run_one:
+        result = run_size(args.run_one, args.seed, args.repeat, args.mutations)
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+
+    report = run_all(args.sizes, args.seed, args.repeat, args.mutations)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report)
+    print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import json
+import os
+
+import pandas as pd
+
+import ledger_index
+import ledger_schema
+from tag_index import TAG_SEPARATORS, split_tags
+
+# ===================== 预算 =====================
+# 预算按 范围（全部/用途/标签/账户）+ 名称 + 周期（周/月/年）设置支出上限，保存在 JSON 文件中（金额为元）。
+# BudgetTotals 维护 (范围, 名称, 周期, 时间段) -> 支出合计（分）的哈希表，覆盖所有用途/标签/账户，
+# 作为派生索引随增删改按差额更新（on_add / on_remove），新增或修改预算不需要重算。
+# 录入时的预算提醒和预算总览只做字典查找，不对账本做 groupby。
+
+SCOPES = ["全部", "用途", "标签", "账户"]
+BUDGET_PERIODS = {"周": "W", "月": "M", "年": "Y"}
+ALL = "全部"          # “全部”范围下唯一的名称
+WARN_RATIO = 0.8      # 支出达到预算的多少比例时提醒
+
+
+def _present(value):
+    return value is not None and not (pd.api.types.is_scalar(value) and pd.isna(value)) and value != ""
+
+
+def budget_keys(record):
+    """一条支出记录计入的 (范围, 名称)"""
+    keys = [(ALL, ALL), ("账户", record["账户"])]
+    if _present(record.get("用途")):
+        keys.append(("用途", record["用途"]))
+    keys.extend(("标签", tag) for tag in split_tags(record.get("标签")))
+    return keys
+
+
+class BudgetTotals:
+    """各范围、各周期每个时间段的支出合计（分）"""
+
+    def __init__(self, df):
+        self.totals = {}
+        if df.empty:
+            return
+        spend = df[df["类型"] == "支出"]
+        tags = spend["标签"].fillna("").astype(str).str.split(TAG_SEPARATORS) if "标签" in spend.columns else None
+        for freq in BUDGET_PERIODS.values():
+            periods = spend["日期"].dt.to_period(freq)
+            purposes = spend["用途"].astype(object)
+            groups = [(ALL, pd.Series(ALL, index=spend.index)), ("账户", spend["账户"]),
+                      ("用途", purposes.where(purposes != ""))]
+            for scope, keys in groups:
+                sums = spend["金额"].groupby([keys, periods], observed=True).sum()
+                self._merge(scope, freq, sums)
+            if tags is not None:
+                pairs = pd.DataFrame({"序号": spend["序号"], "标签": tags, "时间段": periods,
+                                      "金额": spend["金额"]}).explode("标签")
+                # 同一记录重复的标签只计一次
+                pairs = pairs[pairs["标签"].notna() & (pairs["标签"] != "")].drop_duplicates(["序号", "标签"])
+                self._merge("标签", freq, pairs.groupby(["标签", "时间段"])["金额"].sum())
+
+    def _merge(self, scope, freq, sums):
+        for (key, period), amount in sums.items():
+            if amount:
+                self.totals[(scope, key, freq, period)] = int(amount)
+
+    # ---------- 增量维护 ----------
+    def _change(self, record, sign):
+        if record["类型"] != "支出":
+            return
+        date = pd.Timestamp(record["日期"])
+        amount = sign * int(record["金额"])
+        for freq in BUDGET_PERIODS.values():
+            period = date.to_period(freq)
+            for scope, key in budget_keys(record):
+                cell = (scope, key, freq, period)
+                value = self.totals.get(cell, 0) + amount
+                if value == 0:
+                    self.totals.pop(cell, None)
+                else:
+                    self.totals[cell] = value
+
+    def on_add(self, record_id, record):
+        self._change(record, 1)
+
+    def on_remove(self, record_id, record):
+        self._change(record, -1)
+
+    # ---------- 查询 ----------
+    def spent(self, scope, key, freq, period):
+        with ledger_index.locked():
+            return self.totals.get((scope, key, freq, period), 0)
+
+
+# ---------- 预算定义 ----------
+def load_budgets(path):
+    """读取预算列表：[{"范围", "名称", "周期", "上限"(元)}]"""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_budgets(path, budgets):
+    """原子地写入预算列表"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(budgets, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def set_budget(budgets, scope, key, period, limit):
+    """新增或修改预算（同一范围、名称和周期只有一条），返回新列表"""
+    key = ALL if scope == ALL else key
+    kept = [b for b in budgets if (b["范围"], b["名称"], b["周期"]) != (scope, key, period)]
+    return kept + [{"范围": scope, "名称": key, "周期": period, "上限": float(limit)}]
+
+
+def remove_budget(budgets, scope, key, period):
+    return [b for b in budgets if (b["范围"], b["名称"], b["周期"]) != (scope, key, period)]
+
+
+def budget_label(budget):
+    name = "总支出" if budget["范围"] == ALL else f"{budget['范围']}「{budget['名称']}」"
+    return f"{name} {budget['周期']}预算"
+
+
+# ---------- 预算状态 ----------
+def budget_status(totals, budgets, as_of):
+    """各预算在 as_of 所在时间段的执行情况（金额为分）"""
+    as_of = pd.Timestamp(as_of)
+    rows = []
+    for budget in budgets:
+        freq = BUDGET_PERIODS[budget["周期"]]
+        period = as_of.to_period(freq)
+        spent = totals.spent(budget["范围"], budget["名称"], freq, period)
+        limit = ledger_schema.to_fen(budget["上限"])
+        rows.append({
+            "预算": budget_label(budget),
+            "时间段": str(period),
+            "已支出": spent,
+            "上限": limit,
+            "剩余": limit - spent,
+            "使用率": spent / limit if limit else float("nan"),
+        })
+    return pd.DataFrame(rows, columns=["预算", "时间段", "已支出", "上限", "剩余", "使用率"])
+
+
+def check_budgets(totals, budgets, record, old=None):
+    """录入（或把 old 修改为 record）之后会达到提醒线或超支的预算
+
+    返回 [(预算, 录入后的支出(分), 上限(分))]，按使用率降序。
+    """
+    if record.get("类型") != "支出":
+        return []
+    date = pd.Timestamp(record["日期"])
+    keys = set(budget_keys(record))
+    old_keys = set(budget_keys(old)) if old is not None and old["类型"] == "支出" else set()
+    alerts = []
+    for budget in budgets:
+        scope_key = (budget["范围"], budget["名称"])
+        if scope_key not in keys:
+            continue
+        freq = BUDGET_PERIODS[budget["周期"]]
+        period = date.to_period(freq)
+        after = totals.spent(*scope_key, freq, period) + int(record["金额"])
+        # 修改记录时，原记录在同一时间段的金额不重复计算
+        if scope_key in old_keys and pd.Timestamp(old["日期"]).to_period(freq) == period:
+            after -= int(old["金额"])
+        limit = ledger_schema.to_fen(budget["上限"])
+        if after >= limit * WARN_RATIO:
+            alerts.append((budget, after, limit))
+    return sorted(alerts, key=lambda a: a[1] / a[2] if a[2] else float("inf"), reverse=True)
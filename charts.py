@@ -0,0 +1,190 @@
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import profiling
+
+# ===================== 图表渲染与缓存 =====================
+# 图表按 (数据版本, 图表名称, 参数) 缓存为 PNG，数据和参数都没变时直接复用，
+# 不再每次点击都重新绘制。缓存按最近最少使用淘汰，并限制总字节数。
+# 绘图使用独立的 Figure 对象而不是 pyplot，画完立即清空，不会在进程里越积越多。
+# matplotlib 在第一次绘图时才导入，启动和只用交互式图表时都不需要加载它。
+
+MAX_CACHE_BYTES = 64 * 1024 * 1024  # 图表缓存上限
+MAX_CACHE_ENTRIES = 256
+
+
+class ChartCache:
+    """按最近最少使用淘汰的 PNG 缓存"""
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES, max_entries=MAX_CACHE_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.total_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            png = self._items.get(key)
+            if png is not None:
+                self._items.move_to_end(key)
+            return png
+
+    def put(self, key, png):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.total_bytes -= len(old)
+            self._items[key] = png
+            self.total_bytes += len(png)
+            while self._items and (self.total_bytes > self.max_bytes or len(self._items) > self.max_entries):
+                _, evicted = self._items.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+# 进程内所有会话共用
+chart_cache = ChartCache()
+
+
+# ===================== 中文字体支持配置 =====================
+# 探测到的中文字体缓存在磁盘上，字体文件没有变化时下次启动直接使用，不再逐个探测和解析。
+FONT_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "jizhang", "font.json")
+FONT_NAMES = ['SimHei', 'Microsoft YaHei', 'KaiTi', 'Arial Unicode MS', 'sans-serif']  # 通用字体名称回退
+
+
+def font_candidates():
+    """各平台常见的中文字体文件"""
+    if sys.platform.startswith('win'):
+        return [
+            "C:/Windows/Fonts/simhei.ttf",      # 黑体
+            "C:/Windows/Fonts/msyh.ttc",        # 微软雅黑
+            "C:/Windows/Fonts/simkai.ttf",      # 楷体
+        ]
+    if sys.platform.startswith('darwin'):
+        return [
+            "/System/Library/Fonts/PingFang.ttc",  # 苹方
+            "/Library/Fonts/Arial Unicode.ttf",
+            "/System/Library/Fonts/STHeiti Light.ttc",  # 华文黑体
+        ]
+    return [
+        "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",  # Droid Sans
+        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",     # Noto Sans
+    ]
+
+
+def _read_font_cache():
+    try:
+        with open(FONT_CACHE_FILE, encoding="utf-8") as f:
+            cached = json.load(f)
+        if os.path.getmtime(cached["path"]) == cached["mtime"]:
+            return cached["path"], cached["name"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _write_font_cache(path, name):
+    try:
+        os.makedirs(os.path.dirname(FONT_CACHE_FILE), exist_ok=True)
+        with open(FONT_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump({"path": path, "name": name, "mtime": os.path.getmtime(path)}, f, ensure_ascii=False)
+    except OSError:
+        pass  # 缓存写不进去只影响下次启动的速度
+
+
+def find_chinese_font():
+    """返回 (字体文件, 字体名称)，找不到时返回 (None, None)"""
+    cached = _read_font_cache()
+    if cached:
+        return cached
+    for font_path in font_candidates():
+        if os.path.exists(font_path):
+            try:
+                from matplotlib.font_manager import FontProperties
+                font_name = FontProperties(fname=font_path).get_name()
+            except Exception as e:
+                print(f"字体注册失败: {e}")
+                continue
+            _write_font_cache(font_path, font_name)
+            return font_path, font_name
+    return None, None
+
+
+_fonts_ready = False
+_fonts_lock = threading.Lock()
+
+
+def setup_chinese_font_support():
+    """配置Matplotlib支持中文显示（每个进程只做一次）"""
+    global _fonts_ready
+    with _fonts_lock:
+        if _fonts_ready:
+            return
+        import matplotlib
+
+        font_path, font_name = find_chinese_font()
+        if font_name:
+            matplotlib.rcParams['font.family'] = 'sans-serif'
+            matplotlib.rcParams['font.sans-serif'] = [font_name] + FONT_NAMES
+            print(f"使用字体: {font_name} ({font_path})")
+        else:
+            matplotlib.rcParams['font.sans-serif'] = FONT_NAMES
+        # 解决负号显示问题
+        matplotlib.rcParams['axes.unicode_minus'] = False
+        _fonts_ready = True
+
+
+def new_figure(figsize):
+    """配置好中文字体后新建独立的 Figure（不经过 pyplot）"""
+    setup_chinese_font_support()
+    from matplotlib.figure import Figure
+
+    return Figure(figsize=figsize)
+
+
+def render_png(key, draw, figsize):
+    """取缓存的图表；没有时新建 Figure 调用 draw(fig, ax) 绘制并缓存"""
+    png = chart_cache.get(key)
+    if png is not None:
+        return png
+    with profiling.span("render_png", chart=str(key[1])):
+        fig = new_figure(figsize)
+        try:
+            ax = fig.subplots()
+            draw(fig, ax)
+            buffer = BytesIO()
+            fig.savefig(buffer, format="png")
+            png = buffer.getvalue()
+        finally:
+            # 立即释放图形占用的内存
+            fig.clear()
+    chart_cache.put(key, png)
+    return png
+
+
+def _freeze(value):
+    """把参数转换成可哈希的形式"""
+    if hasattr(value, "tolist"):  # numpy 数组/标量、pandas Index
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (int, float, str, bool, type(None))):
+        return value
+    return str(value)
+
+
+def cache_key(version, name, *params):
+    """由数据版本、名称和参数组成缓存键"""
+    return (version, name) + tuple(_freeze(p) for p in params)
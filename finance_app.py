@@ -1,14 +1,33 @@
+import time
+_SCRIPT_START = time.perf_counter()  # 本次运行开始的时间，用于统计首次显示余额的耗时
+
+import numpy as np
 import pandas as pd
 import streamlit as st
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
 import os
-import sys
-# import threading
-import time
-import numpy as np
+import json
+import threading
+from collections import OrderedDict
+
+import budget
+import charts
+import ledger_index
+import ledger_schema
+import profiling
+import statement_import
+import storage
+import trends
+from balance_engine import BalanceEngine, signed_amount, write_back
+from fingerprint_index import FingerprintIndex
+from flush_worker import FlushWorker
+from history import EditHistory, invert, matches, record_snapshot, snapshot, to_memory
+from ledger_data import (BUDGET_FILE, EXCEL_FILE, HISTORY_FILE, calculate_balance, category_totals, get_journal,
+                         get_storage, index_by_id, read_ledger)
+from ledger_journal import encode_record
+from rollup import FREQ_MAP, DailyRollup, period_labels
+from search_index import SearchIndex, parse_query
+from tag_index import TagIndex, normalize_tags
 
 # 设置页面配置，优化移动端显示
 st.set_page_config(
@@ -16,158 +35,391 @@ st.set_page_config(
     layout="centered"  # 或 "centered"
 )
 
-# ===================== 中文字体支持配置 =====================
-def setup_chinese_font_support():
-    """配置Matplotlib支持中文显示"""
-    # 尝试不同平台的中文字体
-    font_candidates = []
-    
-    # Windows 字体路径
-    if sys.platform.startswith('win'):
-        font_candidates = [
-            "C:/Windows/Fonts/simhei.ttf",      # 黑体
-            "C:/Windows/Fonts/msyh.ttc",        # 微软雅黑
-            "C:/Windows/Fonts/simkai.ttf",      # 楷体
-        ]
-    # macOS 字体路径
-    elif sys.platform.startswith('darwin'):
-        font_candidates = [
-            "/System/Library/Fonts/PingFang.ttc",  # 苹方
-            "/Library/Fonts/Arial Unicode.ttf",
-            "/System/Library/Fonts/STHeiti Light.ttc",  # 华文黑体
-        ]
-    # Linux 字体路径
-    else:
-        font_candidates = [
-            "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",  # Droid Sans
-            "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",     # Noto Sans
-        ]
-    
-    # 添加通用字体名称回退
-    font_names = ['SimHei', 'Microsoft YaHei', 'KaiTi', 'Arial Unicode MS', 'sans-serif']
-    
-    # 检查字体文件是否存在
-    found_font = None
-    for font_path in font_candidates:
-        if os.path.exists(font_path):
-            found_font = font_path
-            break
-    
-    # 设置字体
-    if found_font:
-        try:
-            # 注册字体
-            font_prop = mpl.font_manager.FontProperties(fname=found_font)
-            font_name = font_prop.get_name()
-            
-            # 更新配置
-            plt.rcParams['font.family'] = 'sans-serif'
-            plt.rcParams['font.sans-serif'] = [font_name] + font_names
-            print(f"使用字体: {font_name} ({found_font})")
-        except Exception as e:
-            print(f"字体注册失败: {e}")
-            plt.rcParams['font.sans-serif'] = font_names
-    else:
-        # print("未找到字体文件，使用字体名称回退")
-        plt.rcParams['font.sans-serif'] = font_names
-    
-    # 解决负号显示问题
-    plt.rcParams['axes.unicode_minus'] = False
-# 调用字体设置函数
-setup_chinese_font_support()
-# ===================== 结束字体配置 =====================
-
-# 配置文件路径
-EXCEL_FILE = "financial_records.xlsx"
-
-# 初始化Excel文件
-def init_excel_file():
-    if not os.path.exists(EXCEL_FILE):
-        columns = [
-            "序号", "日期", "类型", "账户", "金额", "余额", "来源", "用途", "标签", "备注"
-        ]
-        df = pd.DataFrame(columns=columns)
-        df.to_excel(EXCEL_FILE, index=False)
-
-# 读取Excel数据
+# 中文字体在第一次绘制图表时才配置（见 charts.py），启动时不导入 matplotlib
+
+# 数据管理表格每页条数
+PAGE_SIZES = [50, 100, 200, 500]
+
+# 所有会话共享的账本缓存
+class LedgerCache:
+    """数据版本不变时直接复用已解析、已算好余额的 DataFrame"""
+
+    def __init__(self):
+        self.version = None
+        self.frame = None
+        self.lock = threading.Lock()
+
+    def get(self, version):
+        if self.frame is not None and self.version == version:
+            return self.frame
+        return None
+
+    def put(self, version, frame):
+        # 账本发布后不再修改，把数据版本记在 DataFrame 上：会话拿到的账本可能已不是最新版本，
+        # 视图缓存按它自己的版本取键，不会把旧账本的结果存到新版本下
+        frame.attrs["version"] = version
+        self.version = version
+        self.frame = frame
+
+@st.cache_resource
+def get_ledger_cache():
+    return LedgerCache()
+
+# 读取数据：数据版本（日志和存储文件的大小/修改时间）未变时直接用缓存
+@profiling.profiled()
 def load_data():
-    try:
-        df  = pd.read_excel(EXCEL_FILE, parse_dates=["日期"])
-            # 如果余额列不存在，添加并计算余额
-        if '余额' not in df.columns:
-            df = calculate_balance(df)
-        
-        # 添加排序 - 按序号升序
-        df = df.sort_values(by='序号', ascending=True) #
-        return df
-    except FileNotFoundError:
-        init_excel_file()
-        return pd.DataFrame()
+    return load_cached(get_ledger_cache())
 
-# 计算余额
-def calculate_balance(df):
-    """计算并更新每笔记录的余额"""
-    if df.empty:
+def load_cached(cache):
+    journal = get_journal()
+    # 数据版本只需 stat 两个文件：未变时不取日志写锁（含跨进程的锁文件），直接用缓存
+    version = journal.version()
+    with cache.lock:
+        df = cache.get(version)
+    if df is not None:
         return df
-    
-    # 确保账户列存在
-    if '账户' not in df.columns:
-        df['账户'] = '中行'  # 默认为中行账户
+    # 版本变了：先取日志写锁再取缓存锁（与写入路径的加锁顺序一致），在锁内重新确认版本后读取
+    with journal.lock, cache.lock:
+        version = journal.version()
+        df = cache.get(version)
+        if df is None:
+            df = read_ledger(journal)
+            cache.put(version, df)
+    return df
 
-    # 按日期和索引排序，确保正确的计算顺序
-    df = df.sort_values(by=['账户', '日期'])
-    
-    # 计算每笔记录的金额变动（收入为正，支出为负）
-    df['变动'] = df.apply(lambda row: row['金额'] if row['类型'] == '收入' else -row['金额'], axis=1)
-    
-    # 计算累计余额
-    df['余额'] = df.groupby('账户')['变动'].cumsum()
-    
-    # 删除临时列
-    df = df.drop(columns=['变动'])
-    
+# 写入后把新的 DataFrame 直接放进缓存，下次运行无需重新读取；合并日志和导出交给后台落盘线程
+def publish(df):
+    cache = get_ledger_cache()
+    with cache.lock:
+        cache.put(get_journal().version(), df)
+    get_flush_worker().mark_dirty()
     return df
 
-# 保存数据到Excel
-def save_data(df):
-    # 确保保存前余额已计算
-    if '余额' not in df.columns:
-        df = calculate_balance(df)
-    df.to_excel(EXCEL_FILE, index=False)
+# 与当前账本同步的余额引擎、搜索索引、时间汇总、标签索引和重复记录指纹
+def get_balance_engine(df):
+    return ledger_index.get(df, "balance", BalanceEngine)
 
-# 添加新记录
-def add_record(df, record):
-    # 生成新序号（当前最大序号+1）
-    if df.empty:
-        new_id = 1
+def get_search_index(df):
+    return ledger_index.get(df, "search", SearchIndex)
+
+def get_rollup(df):
+    return ledger_index.get(df, "rollup", DailyRollup)
+
+def get_tag_index(df):
+    return ledger_index.get(df, "tags", TagIndex)
+
+def get_fingerprint_index(df):
+    return ledger_index.get(df, "fingerprints", FingerprintIndex)
+
+def get_budget_totals(df):
+    return ledger_index.get(df, "budgets", budget.BudgetTotals)
+
+# 搜索命中的记录在 df 中的位置（升序）；索引可能领先于本账本，不存在的序号丢弃
+def search_positions(df, search_term):
+    matched_ids = get_search_index(df).search(search_term)
+    positions = df.index.get_indexer(sorted(matched_ids))
+    return positions[positions >= 0]
+
+# 账本 DataFrame 的数据版本（见 LedgerCache.put）
+def frame_version(df):
+    return df.attrs.get("version")
+
+# 缓存键：账本自己的数据版本 + 名称 + 参数（不用缓存中的最新版本，见 LedgerCache.put）
+def version_key(df, name, *params):
+    return charts.cache_key(frame_version(df), name, *params)
+
+# 各视图的计算结果按数据版本和参数缓存，数据没变时切换视图或参数不必重算
+class ViewMemo:
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                return self.items[key]
+        value = compute()
+        with self.lock:
+            self.items[key] = value
+            while len(self.items) > self.max_entries:
+                self.items.popitem(last=False)
+        return value
+
+@st.cache_resource
+def get_view_memo():
+    return ViewMemo()
+
+def memoize(df, name, params, compute):
+    def timed_compute():
+        with profiling.span(f"compute:{name}"):
+            return compute()
+    return get_view_memo().get_or_compute(version_key(df, name, *params), timed_compute)
+
+# 显示图表：交互模式下使用Streamlit原生图表，否则显示缓存的PNG
+def show_chart(key, draw, figsize, native=None):
+    if native is not None and st.session_state.get("interactive_charts"):
+        native()
     else:
-        new_id = df['序号'].max() + 1
-    
-    # 添加序号到记录
-    record_with_id = {"序号": new_id, **record}
-    
-    # 添加新记录
-    new_df = pd.concat([df, pd.DataFrame([record_with_id])], ignore_index=True)
-    # 重新计算所有余额
-    new_df = calculate_balance(new_df)
+        st.image(charts.render_png(key, draw, figsize))
+
+# 导出Excel
+@profiling.profiled()
+def export_excel(df, path=EXCEL_FILE):
+    storage.export_excel(ledger_schema.expand(df), path)
+
+# 落盘：把日志合并进存储后端（在后台落盘线程中执行，不调用 Streamlit）
+def persist(cache):
+    journal = get_journal()
+    # 在写锁内读取最新账本并合并日志，不会用某个会话手里过期的数据覆盖别人的写入
+    with journal.lock:
+        df = load_cached(cache)
+        journal.compact()
+        # 合并只改变存储格式，不改变内容：缓存换成新的数据版本，下次运行不必重新读取
+        with cache.lock:
+            cache.put(journal.version(), df)
+
+# 导出最新的账本到 Excel：较慢，由落盘线程限流执行，安全退出和进程退出时再导出一次
+def export_ledger(cache):
+    # 在锁外导出（账本不会被原地修改），期间的增删改和其他会话的读取不必等待
+    df = load_cached(cache)
+    if len(df) > storage.EXCEL_MAX_ROWS:
+        # 超过工作表行数上限无法导出；账本已完整保存在存储后端
+        print(f"账本共 {len(df):,} 行，超过 Excel 行数上限，跳过导出 {EXCEL_FILE}")
+        return
+    export_excel(df)
+
+@st.cache_resource
+def get_flush_worker():
+    cache = get_ledger_cache()
+    return FlushWorker(lambda: persist(cache), export=lambda: export_ledger(cache))
+
+# 保存数据：立即同步落盘并导出 Excel（安全退出时调用）
+@profiling.profiled()
+def save_data():
+    get_flush_worker().flush()
+
+# ===================== 写入入口 =====================
+# 所有写操作都持有日志写锁（线程锁 + 锁文件），并在锁内基于最新版本的账本执行：
+# 多个会话同时新增记录时各自分配到不同的序号，互不覆盖；
+# 修改和删除先核对记录仍是会话读取时的版本，已被别人改动或删除则拒绝。
+
+class StaleRecordError(Exception):
+    """记录在本会话读取之后已被其他会话修改或删除"""
+
+def check_record(df, index, expected_version):
+    if index not in df.index:
+        raise StaleRecordError(f"记录 {index} 已被其他会话删除")
+    if expected_version is not None and ledger_schema.record_version(df.loc[index]) != expected_version:
+        raise StaleRecordError(f"记录 {index} 已被其他会话修改，请核对后重新提交")
+
+# 操作说明，显示在撤销/重做按钮上
+def describe(action, record_id, record):
+    date = pd.Timestamp(record['日期']).strftime('%Y-%m-%d')
+    return f"{action}记录 {record_id}（{date} {record['账户']} {record['类型']} {ledger_schema.format_yuan(record['金额'])}）"
+
+# 以下三个函数在持有写锁时调用：先写日志，再在账本副本上增量更新，返回新账本（不发布）
+def _insert(df, record_id, record):
+    record_with_id = {"序号": record_id, **record}
+    get_journal().append("add", record_id, ledger_schema.storage_record(record_with_id))
+
+    # 添加新记录（以序号作为行索引）
+    engine = get_balance_engine(df)
+    new_df = ledger_schema.append_rows(df, pd.DataFrame([record_with_id], index=[record_id]))
+    # 只重算该账户从新记录日期开始的余额
+    write_back(new_df, [engine.insert(record['账户'], record['日期'], record_id, signed_amount(record))])
+    ledger_index.notify_add(df, record_id, record_with_id)
+    ledger_index.carry(df, new_df)
     return new_df
 
-# 删除记录
-def delete_record(df, index):
+def _remove(df, index):
+    get_journal().append("delete", df.loc[index, '序号'])
+    engine = get_balance_engine(df)
+    old = df.loc[index]
     # 删除记录
-    new_df = df.drop(index).reset_index(drop=True)
-    # 重新计算所有余额
-    new_df = calculate_balance(new_df)
+    new_df = df.drop(index)
+    # 只重算该账户从被删记录日期开始的余额
+    write_back(new_df, [engine.remove(old['账户'], old['日期'], old['序号'])])
+    ledger_index.notify_remove(df, old['序号'], old)
+    ledger_index.carry(df, new_df)
+    return new_df
+
+def _modify(df, index, updated_record):
+    get_journal().append("update", df.loc[index, '序号'], ledger_schema.storage_record(updated_record))
+    engine = get_balance_engine(df)
+    old = df.loc[index]
+    ledger_index.notify_remove(df, old['序号'], old)
+    # 写时复制：在浅拷贝上更新记录，只复制被修改的列，其他会话手里的旧账本保持不变
+    new_df = df.copy(deep=False)
+    ledger_schema.set_values(new_df, index, updated_record)
+    new = new_df.loc[index]
+    ledger_index.notify_add(df, new['序号'], new)
+    # 从原账户移除、再插入新位置，只重算两处受影响的余额
+    write_back(new_df, [
+        engine.remove(old['账户'], old['日期'], old['序号']),
+        engine.insert(new['账户'], new['日期'], new['序号'], signed_amount(new)),
+    ])
+    ledger_index.carry(df, new_df)
     return new_df
 
+# 添加新记录
+@profiling.profiled()
+def add_record(df, record):
+    with get_journal().lock:
+        df = load_data()
+        history = get_history()
+        history.sync()
+        # 生成新序号（当前最大序号+1）
+        if df.empty:
+            new_id = 1
+        else:
+            new_id = int(df['序号'].max()) + 1
+
+        new_df = _insert(df, new_id, record)
+        history.record(describe("添加", new_id, record),
+                       [{"序号": new_id, "before": None, "after": record_snapshot(new_df.loc[new_id])}])
+        return publish(new_df)
+
+# 批量添加记录（账单导入）
+@profiling.profiled()
+def add_records(df, records):
+    """一次分配连续序号、一次写日志、一次计算余额"""
+    if records.empty:
+        return df
+    with get_journal().lock:
+        df = load_data()
+        history = get_history()
+        history.sync()
+        start = 1 if df.empty else int(df['序号'].max()) + 1
+        records = records.assign(序号=range(start, start + len(records)))
+        records = records[[c for c in storage.STORED_COLUMNS if c in records.columns]]
+        stored = ledger_schema.expand(records).to_dict("records")
+        get_journal().append_many("add", stored)
+        # 整批导入记为一步，可一次撤销
+        history.record(f"导入 {len(stored)} 条记录", [
+            {"序号": int(r["序号"]), "before": None,
+             "after": encode_record({k: v for k, v in r.items() if k != "序号"})}
+            for r in stored
+        ])
+
+        records.index = records['序号'].to_numpy()
+        new_df = ledger_schema.append_rows(df, records)
+        # 整批只重算一次余额，派生索引随之重建
+        return publish(index_by_id(calculate_balance(new_df)))
+
+# 删除记录；expected_version 为会话读取该记录时的版本（ledger_schema.record_version）
+@profiling.profiled()
+def delete_record(df, index, expected_version=None):
+    with get_journal().lock:
+        df = load_data()
+        check_record(df, index, expected_version)
+        history = get_history()
+        history.sync()
+        old = df.loc[index]
+        new_df = _remove(df, index)
+        # 删除时保存整条记录，撤销时按原序号恢复
+        history.record(describe("删除", int(old['序号']), old),
+                       [{"序号": int(old['序号']), "before": record_snapshot(old), "after": None}])
+        return publish(new_df)
+
 # 更新记录
-def update_record(df, index, updated_record):
-    # 更新记录
-    for col in updated_record:
-        df.loc[index, col] = updated_record[col]
-    # 重新计算所有余额
-    df = calculate_balance(df)
-    return df
+@profiling.profiled()
+def update_record(df, index, updated_record, expected_version=None):
+    with get_journal().lock:
+        df = load_data()
+        check_record(df, index, expected_version)
+        history = get_history()
+        history.sync()
+        old = df.loc[index]
+        new_df = _modify(df, index, updated_record)
+        # 只保存被修改字段的前后取值
+        fields = [c for c in updated_record if c in storage.STORED_COLUMNS and c != "序号"]
+        before, after = snapshot(old, fields), snapshot(new_df.loc[index], fields)
+        if before != after:
+            history.record(describe("修改", int(old['序号']), old),
+                           [{"序号": int(old['序号']), "before": before, "after": after}])
+        return publish(new_df)
+
+# ===================== 撤销 / 重做 =====================
+# 撤销和重做把历史中保存的增量（逆向或正向）作为普通的增删改写入日志。
+# 执行前先核对每条记录仍是历史中记录的状态；被其他会话或进程改过则拒绝，避免覆盖别人的修改。
+
+@st.cache_resource
+def get_history():
+    return EditHistory(HISTORY_FILE)
+
+def check_change(df, change):
+    record_id = change["序号"]
+    if change["before"] is None:
+        if record_id in df.index:
+            raise StaleRecordError(f"序号 {record_id} 已被其他记录占用，无法恢复")
+    elif record_id not in df.index:
+        raise StaleRecordError(f"记录 {record_id} 已被删除，无法继续")
+    elif not matches(df.loc[record_id], change["before"]):
+        raise StaleRecordError(f"记录 {record_id} 已被再次修改，无法继续")
+
+def apply_history_changes(df, changes):
+    """把一组变更（before -> after）应用到账本，返回新账本"""
+    for change in changes:
+        check_change(df, change)
+    if len(changes) == 1:
+        change = changes[0]
+        record_id = change["序号"]
+        if change["before"] is None:
+            return _insert(df, record_id, to_memory(change["after"]))
+        if change["after"] is None:
+            return _remove(df, record_id)
+        return _modify(df, record_id, to_memory(change["after"]))
+
+    # 整批导入：一次写日志、一次计算余额
+    journal = get_journal()
+    added = [c for c in changes if c["before"] is None]
+    removed = [c["序号"] for c in changes if c["after"] is None]
+    updated = [c for c in changes if c["before"] is not None and c["after"] is not None]
+    if added:
+        journal.append_many("add", [{"序号": c["序号"], **c["after"]} for c in added])
+    if removed:
+        journal.append_many("delete", [{"序号": record_id} for record_id in removed])
+    if updated:
+        journal.append_many("update", [{"序号": c["序号"], **c["after"]} for c in updated])
+
+    new_df = df.drop(removed) if removed else df.copy(deep=False)
+    for change in updated:
+        ledger_schema.set_values(new_df, change["序号"], to_memory(change["after"]))
+    if added:
+        rows = pd.DataFrame([{"序号": c["序号"], **to_memory(c["after"])} for c in added])
+        rows.index = rows['序号'].to_numpy()
+        new_df = ledger_schema.append_rows(new_df, rows)
+    return index_by_id(calculate_balance(new_df))
+
+# 撤销最近一次操作，返回 (新账本, 被撤销的操作说明)；没有可撤销的操作时说明为 None
+@profiling.profiled()
+def undo(df):
+    with get_journal().lock:
+        df = load_data()
+        history = get_history()
+        history.sync()
+        entry = history.peek_undo()
+        if entry is None:
+            return df, None
+        new_df = apply_history_changes(df, invert(entry["changes"]))
+        history.undone()
+        return publish(new_df), entry["label"]
+
+# 重做最近一次撤销的操作，返回 (新账本, 操作说明)
+@profiling.profiled()
+def redo(df):
+    with get_journal().lock:
+        df = load_data()
+        history = get_history()
+        history.sync()
+        entry = history.peek_redo()
+        if entry is None:
+            return df, None
+        new_df = apply_history_changes(df, entry["changes"])
+        history.redone()
+        return publish(new_df), entry["label"]
 
 
 # ========== 日期转换辅助函数 ==========
@@ -184,11 +436,589 @@ def to_date(timestamp):
 def safe_exit():
     st.stop()  # 停止Streamlit执行，但不退出进程
 
+# ===================== 分析视图 =====================
+# 数据管理视图
+def show_manage_view(df):
+    st.header("账本管理")
+
+    # 添加账户筛选
+    all_accounts = df['账户'].unique().tolist() if not df.empty else []
+    selected_accounts = st.multiselect("选择账户", options=all_accounts, default=all_accounts)
+
+    # 搜索功能
+    col1, col2 = st.columns(2)
+    with col1:
+        search_term = st.text_input("搜索关键词", help="空格分隔表示同时包含，OR 表示或，如：午餐 OR 晚餐；可用 标签:旅游 只搜指定字段")
+    with col2:
+        if not df.empty:
+            min_date = df["日期"].min()
+            max_date = df["日期"].max()
+            date_range = st.date_input("日期范围", [min_date, max_date])
+        else:
+            date_range = st.date_input("日期范围", [pd.Timestamp(datetime.today()), pd.Timestamp(datetime.today())])
+
+    # 添加排序选项 
+    sort_order = st.radio("数据排序方式", ["序号升序", "序号降序"], horizontal=True, index=0)
+
+    # 应用筛选：只计算命中记录在账本中的位置，不复制整本账，最后只取出当前页的行
+    positions = np.arange(len(df))
+
+    with profiling.span("filter") as filter_span:
+        if not df.empty:
+            # 账户筛选
+            # if selected_accounts:
+            #     filtered_df = filtered_df[filtered_df['账户'].isin(selected_accounts)]
+
+            # 通过倒排索引查找命中的记录
+            # 搜索框为空时不筛选，也不构建索引：默认视图冷启动和导入之后不必建全量索引
+            if parse_query(search_term):
+                positions = search_positions(df, search_term)
+
+            if len(date_range) == 2:
+                dates = df["日期"].to_numpy()
+                in_range = ((dates >= pd.Timestamp(date_range[0]).to_datetime64()) &
+                            (dates <= pd.Timestamp(date_range[1]).to_datetime64()))
+                positions = positions[in_range[positions]]
+        filter_span.set(rows=len(positions))
+
+    # 按序号排序（账本以序号为索引，通常已经是升序，降序只需反转）
+    if not df.index.is_monotonic_increasing:
+        positions = positions[np.argsort(df['序号'].to_numpy()[positions], kind='stable')]
+    if sort_order == "序号降序":
+        positions = positions[::-1]
+
+    # 分页：只格式化和发送当前页
+    col1, col2 = st.columns(2)
+    with col1:
+        page_size = st.selectbox("每页条数", PAGE_SIZES, index=1)
+    total = len(positions)
+    page_count = max(1, -(-total // page_size))
+    if st.session_state.get("ledger_page", 1) > page_count:
+        st.session_state["ledger_page"] = page_count
+    with col2:
+        page = st.number_input(f"页码（共 {page_count} 页，{total} 条）", min_value=1, max_value=page_count,
+                               step=1, key="ledger_page")
+    page_df = df.iloc[positions[(page - 1) * page_size:page * page_size]]
+
+    # 显示数据
+    if not df.empty and '余额' in page_df.columns:
+        # 确保按日期降序排序（最新在前）
+        # display_df = filtered_df.copy().sort_values(by='日期', ascending=False)
+        display_df = ledger_schema.expand(page_df)
+        # 格式化日期和余额显示
+        display_df['日期'] = display_df['日期'].dt.strftime('%Y-%m-%d')
+        display_df['余额'] = display_df['余额'].map('¥{:,.2f}'.format)
+        # 将None替换为空字符串
+        display_df = display_df.fillna('')
+        st.dataframe(display_df,hide_index=True, height=600)
+    else:
+        st.dataframe(pd.DataFrame(),hide_index=True, height=600)
+
+
+
+    # 编辑和删除功能
+    if not page_df.empty:
+        st.subheader("编辑或删除记录")
+
+        # 使用自定义序号而不是DataFrame索引，只列出当前页的记录（可输入序号搜索）
+        record_ids = page_df['序号'].tolist()
+        selected_id = st.selectbox("选择记录序号", record_ids, help="只列出当前页的记录，可先用搜索或翻页定位")
+        # 账本以序号为索引，直接定位记录
+        record_index = selected_id
+        record = df.loc[record_index]
+        # 上一次运行时显示的记录版本：点击按钮触发的这次运行里，它就是用户编辑时看到的内容
+        seen_id, seen_version = st.session_state.get("seen_record", (None, None))
+        expected_version = seen_version if seen_id == record_index else ledger_schema.record_version(record)
+
+
+        # edit_index = st.selectbox("选择记录序号", filtered_df.index)
+        # record = filtered_df.loc[edit_index]
+
+        # 显示当前日期（不带时分秒）
+        current_date = record["日期"].to_pydatetime().date()
+        new_date = st.date_input("日期", current_date)
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            # 添加账户编辑
+            new_account = st.selectbox("账户", ["中行", "微信", "支付宝", "浦发", "建行", "其他"], 
+                                     index=["中行", "微信", "支付宝", "浦发", "建行", "其他"].index(record['账户']))
+
+            if record['类型'] == "支出":
+                new_description = st.text_input("来源", ' ', disabled=True)
+                new_category = st.text_input("用途", record["用途"])
+            elif record['类型'] == "收入":
+                new_description = st.text_input("来源", record["来源"])
+                new_category = st.text_input("用途", ' ', disabled=True)
+        with col2:
+            new_amount = st.number_input("金额", value=ledger_schema.to_yuan(record["金额"]))                
+            if record['类型'] == "支出":
+                new_tags = st.text_input("标签", record["标签"])
+            elif record['类型'] == "收入":
+                new_tags = st.text_input("标签", ' ', disabled=True)
+
+        new_note = st.text_area("备注", record["备注"] if pd.notnull(record["备注"]) else '')
+
+        date_without_time = datetime.combine(new_date, datetime.min.time())
+        updated_record = {
+            "日期": pd.Timestamp(date_without_time),
+            "账户": new_account,
+            "来源": new_description if record['类型']=='收入' else None,
+            "用途": new_category if record['类型']=='支出' else None,
+            "金额": ledger_schema.to_fen(new_amount),
+            "标签": normalize_tags(new_tags) if record['类型']=='支出' else None,
+            "备注": new_note
+        }
+        # 修改后的记录是否会超出预算（原记录的金额不重复计算）
+        show_budget_alerts(df, {**record.to_dict(), **updated_record}, old=record)
+
+        col10, col20 = st.columns(2)
+        with col10:
+            if st.button("更新记录"):
+                try:
+                    df = update_record(df, record_index, updated_record, expected_version)
+                except StaleRecordError as e:
+                    st.error(str(e))
+                else:
+                    st.success("记录更新成功!")  
+                    # 显示更新后的余额
+                    # current_balance = df['余额'].iloc[-1]
+                    # st.success(f"当前余额更新为: ¥{current_balance:,.2f}")
+                    st.rerun()  # 刷新页面显示最新余额
+
+        with col20:
+            if st.button("删除记录"):
+                try:
+                    df = delete_record(df, record_index, expected_version)
+                except StaleRecordError as e:
+                    st.error(str(e))
+                else:
+                    st.success("记录删除成功!")
+                    st.rerun()  # 刷新页面显示最新余额
+
+        st.session_state["seen_record"] = (record_index, ledger_schema.record_version(record))
+    else:
+        st.warning("没有可编辑的记录")
+
+# 时间分析视图
+def show_time_view(df):
+    st.header("时间维度分析")
+
+    if df.empty:
+        st.warning("暂无数据")
+    else:
+        # 添加账户筛选
+        all_accounts = df['账户'].unique().tolist()
+        selected_accounts = st.multiselect("选择账户（时间分析）", options=all_accounts, default=all_accounts)
+
+        # 搜索功能
+        col1, col2 = st.columns(2)
+        with col1:
+            # 设置时间范围
+            min_date = df["日期"].min()
+            max_date = df["日期"].max()
+            start_date, end_date = st.date_input("选择时间范围", [min_date, max_date])
+
+        # 按时间频率分组
+        with col2:
+            freq = st.selectbox("时间频率", ["日", "周", "月", "季", "年"])
+
+        # 由日汇总表按账户、时间范围筛选后再按频率聚合
+        def compute_periods():
+            result = get_rollup(df).period_totals(
+                FREQ_MAP[freq], start_date, end_date,
+                accounts=selected_accounts if selected_accounts else None,
+            )
+            result.index = period_labels(result.index, FREQ_MAP[freq])
+            return ledger_schema.to_yuan(result)
+        result = memoize(df, "time", (selected_accounts, start_date, end_date, freq), compute_periods)
+
+        # 绘制图表
+        def draw_time(fig, ax):
+            result[["收入", "支出"]].plot(kind="bar", ax=ax)
+            ax.set_title(f"{freq}度收支情况")
+            ax.set_ylabel("金额")
+            ax.set_xlabel("日期")
+            ax.tick_params(axis="x", labelrotation=45)
+            fig.tight_layout()
+        show_chart(
+            version_key(df, "time", selected_accounts, start_date, end_date, freq), draw_time, (12, 6),
+            native=lambda: st.bar_chart(result[["收入", "支出"]], stack=False),
+        )
+
+        # 显示数据
+        st.subheader("详细数据")
+        st.dataframe(result)
+
+# 分类分析视图
+def show_category_view(df):
+    st.header("分类维度分析")
+
+    if df.empty:
+        st.warning("暂无数据")
+    else:
+        # 添加账户筛选
+        all_accounts = df['账户'].unique().tolist()
+        selected_accounts = st.multiselect("选择账户（分类分析）", options=all_accounts, default=all_accounts)
+
+        # 选择分析类型
+        analysis_type = st.radio("分析类型", ["支出分类", "收入分类"])
+        target = "支出" if analysis_type == "支出分类" else "收入"
+
+        def compute_categories():
+            row_count, stats = category_totals(df, target, selected_accounts)
+            return row_count, ledger_schema.to_yuan(stats)
+        row_count, category_stats = memoize(df, "categories", (selected_accounts, target), compute_categories)
+
+        if row_count == 0:
+            st.warning(f"无{target}数据")
+        else:
+            # 检查是否有数据可展示
+            if category_stats.empty:
+                st.warning(f"没有可用的{target}分类数据")
+            else:
+                # 绘制饼图
+                def draw_pie(fig, ax):
+                    category_stats.plot(kind="pie", autopct="%1.1f%%", ax=ax)
+                    ax.set_title(f"{target}分类占比")
+                    ax.set_ylabel("")
+                show_chart(
+                    version_key(df, "category_pie", selected_accounts, target), draw_pie, (8, 8),
+                    native=lambda: st.vega_lite_chart(category_stats.reset_index(), {
+                        "mark": {"type": "arc", "tooltip": True},
+                        "encoding": {
+                            "theta": {"field": "金额", "type": "quantitative"},
+                            "color": {"field": "用途", "type": "nominal", "sort": "-theta"},
+                        },
+                    }),
+                )
+
+                # 绘制条形图 - 添加错误处理
+                try:
+                    def draw_category_bar(fig, ax):
+                        category_stats.plot(kind="bar", ax=ax)
+                        ax.set_title(f"{target}分类分布")
+                        ax.set_ylabel("金额")
+
+                        # 设置X轴标签旋转，避免重叠
+                        for label in ax.get_xticklabels():
+                            label.set(rotation=45, ha='right')
+                        fig.tight_layout()
+
+                    show_chart(
+                        version_key(df, "category_bar", selected_accounts, target), draw_category_bar, (10, 6),
+                        native=lambda: st.bar_chart(category_stats),
+                    )
+                except Exception as e:
+                    st.error(f"绘制条形图时出错: {str(e)}")
+                    st.info("可能是因为没有足够的数据来绘制图表")
+
+                # 显示数据
+                st.subheader("分类详细数据")
+                st.dataframe(category_stats)
+
+# 趋势分析视图：滚动支出、环比/同比和月末预测
+def show_trend_view(df):
+    st.header("支出趋势分析")
+
+    if df.empty:
+        st.warning("暂无数据")
+        return
+
+    all_accounts = df['账户'].unique().tolist()
+    selected_accounts = st.multiselect("选择账户（趋势分析）", options=all_accounts, default=all_accounts)
+    accounts = selected_accounts if selected_accounts else None
+
+    # 所选账户的第一笔支出：截至日期不能早于它，否则没有可分析的月份
+    first_spend = memoize(df, "trend_first", (accounts,), lambda: df["日期"][
+        (df["类型"] == "支出") & (df["账户"].isin(accounts) if accounts else True)].min())
+    if pd.isna(first_spend):
+        st.warning("没有支出数据")
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        dimension = st.radio("分组方式", ["用途", "标签"], horizontal=True)
+    with col2:
+        # 默认截至今天；账本最后一笔早于今天时截至最后一笔的日期
+        default = max(first_spend, min(pd.Timestamp(datetime.today()), df["日期"].max()))
+        as_of = st.date_input("截至日期", value=default.date(), min_value=first_spend.date())
+    as_of = pd.Timestamp(as_of)
+
+    # 日 × 分组 的支出宽表（连续到截至日期），随数据版本缓存
+    total = memoize(df, "trend_total", (accounts, as_of),
+                    lambda: trends.daily_matrix(df, accounts=accounts, end=as_of))
+    if total.empty:
+        st.warning("没有支出数据")
+        return
+    groups = memoize(df, "trend_groups", (accounts, dimension, as_of), lambda: trends.daily_matrix(
+        df if dimension == "用途" else get_tag_index(df).pairs(), dimension, accounts, end=as_of))
+
+    # 滚动支出
+    st.subheader("滚动支出")
+    span = st.radio("显示范围", ["近90天", "近1年", "全部"], index=1, horizontal=True)
+    days = {"近90天": 90, "近1年": 365}.get(span)
+    rolling = memoize(df, "trend_rolling", (accounts, as_of, days), lambda: ledger_schema.to_yuan(
+        trends.rolling_spend(total[trends.TOTAL]).loc[:as_of].iloc[-(days or len(total)):]))
+
+    def draw_rolling(fig, ax):
+        ax.bar(rolling.index, rolling["日支出"], color="lightgray", label="日支出")
+        for window in trends.ROLLING_WINDOWS:
+            ax.plot(rolling.index, rolling[f"{window}日均值"], label=f"{window}日均值")
+        ax.set_title("每日支出与滚动均值")
+        ax.set_ylabel("金额")
+        ax.legend()
+        fig.autofmt_xdate()
+        fig.tight_layout()
+    show_chart(
+        version_key(df, "trend_rolling", accounts, as_of, days), draw_rolling, (12, 5),
+        native=lambda: st.line_chart(rolling),
+    )
+
+    # 月末预测
+    st.subheader(f"{as_of:%Y年%m月}月末支出预测")
+    forecast = memoize(df, "trend_forecast", (accounts, dimension, as_of), lambda: (
+        trends.project_month_end(total, as_of),
+        None if groups.empty else trends.project_month_end(groups, as_of)))
+    total_forecast, group_forecast = forecast
+    row = total_forecast.loc[trends.TOTAL]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("本月已支出", ledger_schema.format_yuan(row["本月已支出"]))
+    col2.metric("预计月末支出", ledger_schema.format_yuan(row["预计月末"]),
+                delta=f"{ledger_schema.to_yuan(row['预计月末'] - row['上月']):,.2f} 较上月", delta_color="inverse")
+    col3.metric(f"近{trends.FORECAST_WINDOW}日日均", ledger_schema.format_yuan(row[f"近{trends.FORECAST_WINDOW}日日均"]))
+    st.caption(f"预计月末 = 本月已支出 + 剩余 {total_forecast.attrs['remaining_days']} 天 × "
+               f"近{trends.FORECAST_WINDOW}日日均支出")
+    if group_forecast is not None:
+        group_forecast = group_forecast[(group_forecast != 0).any(axis=1)].sort_values("预计月末", ascending=False)
+        st.dataframe(ledger_schema.to_yuan(group_forecast).round(2))
+
+    # 环比 / 同比
+    st.subheader(f"各{dimension}环比 / 同比")
+    months = pd.period_range(total.index.min(), as_of, freq="M")[::-1]
+    if months.empty:
+        st.warning("截至日期之前没有支出")
+        return
+    month = st.selectbox("月份", months, format_func=lambda m: m.strftime("%Y-%m"))
+    # 截至日期所在的月份尚未结束时，各期都只比较 1 日到截至日期当天
+    through_day = None
+    if month == as_of.to_period("M") and as_of != as_of + pd.offsets.MonthEnd(0):
+        through_day = as_of.day
+        st.caption(f"本月尚未结束，各期均按每月 1 日至 {through_day} 日同口径对比")
+
+    def compute_changes():
+        wide = pd.concat([total, groups], axis=1).fillna(0).loc[:as_of]
+        changes = trends.period_changes(wide, month, through_day)
+        money = ["本月", "上月", "去年同月", "环比", "同比"]
+        changes[money] = ledger_schema.to_yuan(changes[money])
+        return changes.round(2)
+    changes = memoize(df, "trend_changes", (accounts, dimension, as_of, month, through_day), compute_changes)
+    st.dataframe(changes)
+
+# 录入或修改支出时的预算提醒：只查询维护好的预算合计
+def show_budget_alerts(df, record, old=None):
+    budgets = budget.load_budgets(BUDGET_FILE)
+    if not budgets:
+        return
+    for item, after, limit in budget.check_budgets(get_budget_totals(df), budgets, record, old):
+        message = (f"{budget.budget_label(item)}：保存后本期支出 {ledger_schema.format_yuan(after)}"
+                   f" / 上限 {ledger_schema.format_yuan(limit)}")
+        if after > limit:
+            st.error(f"超出{message}")
+        else:
+            st.warning(f"接近{message}")
+
+# 预算视图：各预算的执行情况，以及预算的设置
+def show_budget_view(df):
+    st.header("预算")
+    budgets = budget.load_budgets(BUDGET_FILE)
+
+    if budgets:
+        as_of = st.date_input("统计日期", datetime.today(), key="budget_as_of")
+        status = budget.budget_status(get_budget_totals(df), budgets, as_of)
+        for col in ["已支出", "上限", "剩余"]:
+            status[col] = ledger_schema.to_yuan(status[col])
+        over = status[status["剩余"] < 0]
+        if not over.empty:
+            st.error(f"已超支：{'、'.join(over['预算'])}")
+        st.dataframe(status, hide_index=True, column_config={
+            "使用率": st.column_config.ProgressColumn("使用率", format="percent", min_value=0, max_value=1),
+        })
+    else:
+        st.info("还没有设置预算")
+
+    st.subheader("设置预算")
+    col1, col2 = st.columns(2)
+    with col1:
+        scope = st.selectbox("范围", budget.SCOPES, key="budget_scope")
+    with col2:
+        period = st.selectbox("周期", list(budget.BUDGET_PERIODS), index=1, key="budget_period")
+    if scope == budget.ALL:
+        key = budget.ALL
+    else:
+        if df.empty:
+            options = []
+        elif scope == "标签":
+            options = sorted(get_tag_index(df).postings)
+        else:
+            options = sorted(df[scope].dropna().astype(str).unique().tolist())
+        key = st.selectbox("名称", options, key="budget_key", accept_new_options=True)
+    limit = st.number_input("上限（元）", min_value=0.01, value=1000.0, step=100.0, key="budget_limit")
+    if st.button("保存预算", disabled=not key):
+        budget.save_budgets(BUDGET_FILE, budget.set_budget(budgets, scope, key, period, limit))
+        st.rerun()
+
+    if budgets:
+        labels = {budget.budget_label(item): item for item in budgets}
+        selected = st.selectbox("删除预算", list(labels), key="budget_remove")
+        if st.button("删除", key="budget_remove_button"):
+            item = labels[selected]
+            budget.save_budgets(BUDGET_FILE, budget.remove_budget(budgets, item["范围"], item["名称"], item["周期"]))
+            st.rerun()
+
+# 标签分析视图
+def show_tag_view(df):
+    # st.header("标签维度分析")
+
+    if df.empty:
+        st.warning("暂无数据")
+        return
+
+    # 添加账户筛选
+    all_accounts = df['账户'].unique().tolist()
+    selected_accounts = st.multiselect("选择账户（标签分析）", options=all_accounts, default=all_accounts)
+
+    # 标签关联表随记录增删改维护，这里只按账户筛选
+    tag_index = get_tag_index(df)
+    tag_accounts = selected_accounts if selected_accounts else None
+    has_tags = memoize(df, "tag_any", (tag_accounts,), lambda: not tag_index.filtered(accounts=tag_accounts).empty)
+    if not has_tags:
+        st.warning("没有有效的标签数据")
+        return
+
+    col100, _ , col200 = st.columns([7,0.4,7])
+
+    # with col100:
+    st.header("各标签分布")
+    # 标签分析参数设置
+    col1, col2 = st.columns(2)
+    with col1:
+        tag_type = st.radio("收支类型", ["全部", "支出", "收入"])
+    with col2:
+        min_count = st.slider("最小出现次数", 1, 20, 1)
+
+    # 计算标签统计
+    tag_stats = memoize(df, "tag_stats", (tag_accounts, tag_type, min_count),
+                        lambda: tag_index.stats(tag_type, tag_accounts, min_count).pipe(
+                            lambda s: s.assign(sum=ledger_schema.to_yuan(s["sum"]))))
+
+    if tag_stats.empty:
+        st.warning("没有符合条件的标签数据")
+        return
+
+    # 显示标签统计概览
+    def draw_tags(fig, ax):
+        tag_stats["sum"].plot(kind="bar", ax=ax)
+        ax.set_title(f"标签分析 ({tag_type})")
+        ax.set_ylabel("金额")
+    show_chart(
+        version_key(df, "tags", tag_accounts, tag_type, min_count), draw_tags, (12, 8),
+        native=lambda: st.bar_chart(tag_stats["sum"]),
+    )
+
+    st.subheader("标签详细数据")
+    st.dataframe(tag_stats)
+
+    # with col200:
+    # 标签详细分析部分
+    # st.markdown("---")
+    st.header("特定标签")
+
+    selected_tag = st.selectbox("选择要查看的标签", tag_stats.index)
+    # 通过索引直接取出带该标签的记录，再按类型和账户筛选
+    # 索引可能已包含其他会话刚添加的记录，只取本账本中存在的序号
+    tag_records = df.loc[df.index.intersection(sorted(tag_index.record_ids(selected_tag)))]
+    if tag_type != "全部":
+        tag_records = tag_records[tag_records["类型"] == tag_type]
+    if tag_accounts is not None:
+        tag_records = tag_records[tag_records["账户"].isin(tag_accounts)]
+
+    if tag_records.empty:
+        st.warning(f"没有找到标签 '{selected_tag}' 的记录")
+        return
+
+    # 格式化显示记录
+    display_records = (
+        ledger_schema.expand(tag_records).assign(
+            日期=lambda x: x["日期"].dt.strftime('%Y-%m-%d'),
+            金额=lambda x: x["金额"].map('¥{:,.2f}'.format)
+        )
+        .fillna('')
+        .sort_values('日期', ascending=False)
+    )
+
+    st.dataframe(display_records[["日期", "类型", "金额", "用途", "备注"]])
+
+    # 绘制时间趋势图
+    st.subheader(f"'{selected_tag}'标签的时间趋势")
+    time_grouped = ledger_schema.to_yuan(tag_records.groupby(pd.Grouper(key="日期", freq="ME"))["金额"].sum())
+
+    if len(time_grouped) > 1:
+        def draw_trend(fig, ax):
+            time_grouped.plot(kind="line", marker="o", ax=ax)
+            ax.set_title(f"'{selected_tag}'标签的月度趋势")
+            ax.set_ylabel("金额")
+            ax.grid(True)
+        show_chart(
+            version_key(df, "tag_trend", tag_accounts, tag_type, selected_tag), draw_trend, (12, 6),
+            native=lambda: st.line_chart(time_grouped),
+        )
+    else:
+        st.info("数据点不足，无法显示趋势图")
+
+# 各账户截至某日（含当天）的余额（账户 -> 余额，单位为分），date 为 None 时为最新余额
+# 由余额引擎按日期二分查找，不再逐个账户筛选整本账
+def get_account_balances(df, date=None):
+    engine = get_balance_engine(df)
+    accounts = df['账户'].unique().tolist()
+    with ledger_index.locked():
+        return {account: engine.balance_as_of(account, date) for account in accounts}
+
+# 性能调试面板：URL 带 ?debug=1 或设置环境变量 JIZHANG_DEBUG 时才显示
+TRACE_HISTORY = 20  # 保留最近多少次运行的记录用于导出
+
+def show_debug_panel(trace):
+    if not (os.environ.get("JIZHANG_DEBUG") or st.query_params.get("debug") == "1"):
+        return
+    with st.sidebar:
+        st.markdown("---")
+        with st.expander("性能调试"):
+            if "first_balance_ms" in st.session_state:
+                st.caption(f"本会话首次显示余额耗时 {st.session_state['first_balance_ms']:.0f} ms")
+            worker = get_flush_worker()
+            st.caption(f"后台落盘 {worker.flush_count} 次，导出 {worker.export_count} 次"
+                       + ("，有未落盘的变更" if worker.dirty else "")
+                       + (f"，最近一次失败: {worker.last_error}" if worker.last_error else ""))
+            st.toggle("记录每次运行的耗时", key="profiling", help="开启后从下一次运行开始记录")
+            if trace is None:
+                return
+            history = st.session_state.setdefault("traces", [])
+            history.append(trace)
+            del history[:-TRACE_HISTORY]
+
+            st.caption(f"本次运行共 {trace.total_ms():.1f} ms")
+            st.dataframe(trace.to_frame(), hide_index=True)
+            st.download_button("导出 Chrome trace", json.dumps(profiling.chrome_trace(history), ensure_ascii=False),
+                               file_name="jizhang_trace.json", mime="application/json")
+            st.download_button("导出 JSON 日志", "\n".join(line for t in history for line in t.log_lines()),
+                               file_name="jizhang_trace.jsonl", mime="application/x-ndjson")
+
 # 主应用
 def main():
-    # 初始化文件
-    init_excel_file()
-    
+    # 性能剖析：在调试面板中开启后，记录本次运行各阶段的耗时
+    profiling.begin(st.session_state.get("profiling", False), name=datetime.now().strftime("%H:%M:%S"))
+
     # 加载数据
     df = load_data()
     
@@ -196,48 +1026,75 @@ def main():
     
     # 在右上角添加退出按钮 - 使用空列保持布局
     col1, col2, col3 = st.columns([3, 3, 1])
+    with col2:
+        # 撤销/重做最近的增删改
+        history = get_history()
+        history.sync()
+        undo_col, redo_col = st.columns(2)
+        with undo_col:
+            if st.button("↶ 撤销", key="undo_button", disabled=history.undo_label is None,
+                         help=f"撤销：{history.undo_label}" if history.undo_label else "没有可撤销的操作"):
+                try:
+                    df, label = undo(df)
+                except StaleRecordError as e:
+                    st.error(str(e))
+                else:
+                    st.toast(f"已撤销：{label}")
+                    st.rerun()
+        with redo_col:
+            if st.button("↷ 重做", key="redo_button", disabled=history.redo_label is None,
+                         help=f"重做：{history.redo_label}" if history.redo_label else "没有可重做的操作"):
+                try:
+                    df, label = redo(df)
+                except StaleRecordError as e:
+                    st.error(str(e))
+                else:
+                    st.toast(f"已重做：{label}")
+                    st.rerun()
     with col3:
         if st.button("安全退出", key="exit_button", help="保存数据并退出程序"):
-            save_data(df)  # 确保数据保存
-            safe_exit()
+            try:
+                save_data()  # 合并日志并导出最新账本
+            except Exception as e:
+                st.error(f"保存失败，记录仍保存在日志中，下次启动时会恢复: {e}")
+            else:
+                safe_exit()
     
     st.markdown("---")
 
     # 显示个账户余额及总余额
-    if not df.empty:
-        # 获取所有账户
-        accounts = df['账户'].unique()
-        
-        # 获取每个账户的最新余额
-        account_balances = {}
-        total_balance = 0
-        
-        for account in accounts:
-            account_df = df[df['账户'] == account]
-            if not account_df.empty:
-                # 获取该账户最后一条记录的余额
-                account_balance = account_df['余额'].iloc[-1]
-                account_balances[account] = account_balance
-                total_balance += account_balance
+    with profiling.span("balance_cards"):
+        if not df.empty:
+            # 获取每个账户的余额（默认最新，可选择查看历史某日的余额）
+            balance_date = st.date_input("余额截至日期", value=None, key="balance_date",
+                                         help="留空显示最新余额")
+            account_balances = get_account_balances(df, balance_date)
+            accounts = list(account_balances)
+            total_balance = sum(account_balances.values())
         
-        # 创建列显示各账户余额
-        cols = st.columns(len(accounts))  # +1 用于总余额
+            # 创建列显示各账户余额
+            cols = st.columns(len(accounts))  # +1 用于总余额
         
-        for i, account in enumerate(accounts):
-            with cols[i]:
-                st.metric(f"{account}余额", f"¥{account_balances.get(account, 0):,.2f}")
+            for i, account in enumerate(accounts):
+                with cols[i]:
+                    st.metric(f"{account}余额", ledger_schema.format_yuan(account_balances.get(account, 0)))
         
-        # 在最后一列显示总余额
-        # with cols[-1]:
-        #     st.metric("总余额", f"¥{total_balance:,.2f}")
+            # 在最后一列显示总余额
+            # with cols[-1]:
+            #     st.metric("总余额", f"¥{total_balance:,.2f}")
 
-        st.metric("总余额", f"¥{total_balance:,.2f}")
+            st.metric("总余额", ledger_schema.format_yuan(total_balance))
 
-    else:
-        st.info("暂无记录，当前余额为 ¥0.00")
+        else:
+            st.info("暂无记录，当前余额为 ¥0.00")
+
+    # 每个会话记录一次从脚本开始执行到显示出余额的耗时
+    if "first_balance_ms" not in st.session_state:
+        st.session_state["first_balance_ms"] = (time.perf_counter() - _SCRIPT_START) * 1000
+        print(f"首次显示余额耗时: {st.session_state['first_balance_ms']:.0f} ms")
     
     # 侧边栏 - 添加新记录
-    with st.sidebar:
+    with st.sidebar, profiling.span("sidebar"):
         st.header("添加新记录")
         date = st.date_input("日期", datetime.today())
         # 添加账户选择
@@ -250,419 +1107,96 @@ def main():
         if trans_type == "支出":
             description = st.text_input("来源", "", key="source_input", disabled=True)
             category = st.selectbox("用途", ["饮", "零食", "吃饭", "请客", "月度", "网购", "交通", "购物", "娱乐", "住房", "医疗", "教育", "其他"], key="purpose_select")
-            tags = st.text_input("标签(用逗号分隔)", "", key="tags_input")
+            tags = st.text_input("标签(用空格或逗号分隔)", "", key="tags_input")
         else:
             # 收入记录 - 禁用用途和标签
             description = st.text_input("来源", "工资", key="source_input")
             category = st.selectbox("用途", ["饮", "零食", "吃饭", "请客", "月度" ,"网购", "交通", "购物", "娱乐", "住房", "医疗", "教育", "其他"], 
                                    key="purpose_select", disabled=True)
-            tags = st.text_input("标签(用逗号分隔)", "", key="tags_input", disabled=True)
+            tags = st.text_input("标签(用空格或逗号分隔)", "", key="tags_input", disabled=True)
         
         note = st.text_area("备注")
         
+        new_record = {
+            "日期": to_timestamp(date),
+            "类型": trans_type,
+            "账户": account,
+            "金额": ledger_schema.to_fen(amount),
+            "来源": description if trans_type=='收入' else None,
+            "用途": category if trans_type=='支出' else None,
+            "标签": normalize_tags(tags) if trans_type=='支出' else None,
+            "备注": note
+        }
+        # 录入前检查是否与已有记录重复
+        duplicate_ids = get_fingerprint_index(df).duplicates_of(new_record)
+        if duplicate_ids:
+            st.warning(f"可能重复：已有相同的记录（序号 {', '.join(str(i) for i in sorted(duplicate_ids))}）")
+        # 录入前按维护好的预算合计检查是否超支
+        show_budget_alerts(df, new_record)
+
         if st.button("添加记录"):
-            new_record = {
-                "日期": to_timestamp(date),
-                "类型": trans_type,
-                "账户": account,
-                "金额": amount,
-                "来源": description if trans_type=='收入' else None,
-                "用途": category if trans_type=='支出' else None,
-                "标签": tags if trans_type=='支出' else None,
-                "备注": note
-            }
             df = add_record(df, new_record)
-            save_data(df)
             st.success("记录添加成功!")
             # 显示更新后的余额
             # current_balance = df['余额'].iloc[-1]
             # st.success(f"当前余额更新为: ¥{current_balance:,.2f}")
             st.rerun() # 刷新显示最新余额
 
-    # 主界面布局
-    tab1, tab2, tab3, tab4 = st.tabs([ "数据管理","时间统计", "分类统计", "标签统计"])
-    
-    with tab1:  # 数据管理
-        st.header("账本管理")
-
-        # 添加账户筛选
-        all_accounts = df['账户'].unique() if not df.empty else []
-        selected_accounts = st.multiselect("选择账户", options=all_accounts, default=all_accounts)
-        
-        # 搜索功能
-        col1, col2 = st.columns(2)
-        with col1:
-            search_term = st.text_input("搜索关键词")
-        with col2:
-            if not df.empty:
-                min_date = df["日期"].min()
-                max_date = df["日期"].max()
-                date_range = st.date_input("日期范围", [min_date, max_date])
-            else:
-                date_range = st.date_input("日期范围", [pd.Timestamp(datetime.today()), pd.Timestamp(datetime.today())])
-        
-        # 添加排序选项 
-        sort_order = st.radio("数据排序方式", ["序号升序", "序号降序"], horizontal=True, index=0)
-
-        # 应用筛选
-        filtered_df = df.copy()
-        
-        if not df.empty:
-            # 账户筛选
-            # if selected_accounts:
-            #     filtered_df = filtered_df[filtered_df['账户'].isin(selected_accounts)]
-
-            # if search_term:
-            #     filtered_df = filtered_df[
-            #         filtered_df["来源"].str.contains(search_term, case=False) |
-            #         filtered_df["用途"].str.contains(search_term, case=False) |
-            #         filtered_df["标签"].str.contains(search_term, case=False) |
-            #         filtered_df["备注"].str.contains(search_term, case=False) |
-            #         filtered_df["账户"].str.contains(search_term, case=False)
-            #     ]
-            
-            # 创建一个空的布尔序列，用于存储匹配结果
-            mask = pd.Series(False, index=filtered_df.index)
-            
-            # 对每个可能包含搜索词的列进行检查
-            for column in ["来源", "用途", "标签", "备注", "账户"]:
-                # 只对非空值进行检查
-                if column in filtered_df.columns:
-                    # 将NaN转换为空字符串，然后检查是否包含搜索词
-                    column_mask = filtered_df[column].fillna('').astype(str).str.contains(search_term, case=False, na=False)
-                    mask = mask | column_mask
-            
-            # 应用筛选
-            filtered_df = filtered_df[mask]
-            
-            if len(date_range) == 2:
-                filtered_df = filtered_df[
-                    (filtered_df["日期"] >= pd.Timestamp(date_range[0])) &
-                    (filtered_df["日期"] <= pd.Timestamp(date_range[1]))
-            ]
-        
-        # 按序号排序 
-        if sort_order == "序号升序":
-            filtered_df = filtered_df.sort_values(by='序号', ascending=True)
-        else:
-            filtered_df = filtered_df.sort_values(by='序号', ascending=False)
-
-        # 显示数据
-        if not df.empty and '余额' in filtered_df.columns:
-            # 确保按日期降序排序（最新在前）
-            # display_df = filtered_df.copy().sort_values(by='日期', ascending=False)
-            # # 格式化余额列显示
-            display_df = filtered_df.copy()
-            # 格式化日期显示
-            display_df['日期'] = display_df['日期'].dt.strftime('%Y-%m-%d')
-            display_df['余额'] = display_df['余额'].apply(lambda x: f"¥{x:,.2f}")
-            # 将None替换为空字符串
-            display_df = display_df.fillna('')
-            st.dataframe(display_df,hide_index=True, height=600)
-        else:
-            st.dataframe(pd.DataFrame(),hide_index=True, height=600)
-
-
-
-        # 编辑和删除功能
-        if not filtered_df.empty:
-            st.subheader("编辑或删除记录")
-        
-            # 使用自定义序号而不是DataFrame索引
-            record_ids = filtered_df['序号'].tolist()
-            selected_id = st.selectbox("选择记录序号", record_ids)
-            # 根据选择的序号找到对应的记录
-            record_index = filtered_df[filtered_df['序号'] == selected_id].index[0]
-            record = df.loc[record_index]
-        
-
-            # edit_index = st.selectbox("选择记录序号", filtered_df.index)
-            # record = filtered_df.loc[edit_index]
-            
-            # 显示当前日期（不带时分秒）
-            current_date = record["日期"].to_pydatetime().date()
-            new_date = st.date_input("日期", current_date)
-
-            col1, col2 = st.columns(2)
-
-            with col1:
-                # 添加账户编辑
-                new_account = st.selectbox("账户", ["中行", "微信", "支付宝", "浦发", "建行", "其他"], 
-                                         index=["中行", "微信", "支付宝", "浦发", "建行", "其他"].index(record['账户']))
-
-                if record['类型'] == "支出":
-                    new_description = st.text_input("来源", ' ', disabled=True)
-                    new_category = st.text_input("用途", record["用途"])
-                elif record['类型'] == "收入":
-                    new_description = st.text_input("来源", record["来源"])
-                    new_category = st.text_input("用途", ' ', disabled=True)
-            with col2:
-                new_amount = st.number_input("金额", value=record["金额"])                
-                if record['类型'] == "支出":
-                    new_tags = st.text_input("标签", record["标签"])
-                elif record['类型'] == "收入":
-                    new_tags = st.text_input("标签", ' ', disabled=True)
-            
-            new_note = st.text_area("备注", record["备注"] if pd.notnull(record["备注"]) else '')
-            
-            col10, col20 = st.columns(2)
-            with col10:
-                if st.button("更新记录"):
-                    
-                    date_without_time = datetime.combine(new_date, datetime.min.time())
-                    updated_record = {
-                        "日期": pd.Timestamp(date_without_time),
-                        "账户": new_account,
-                        "来源": new_description if record['类型']=='收入' else None,
-                        "用途": new_category if record['类型']=='支出' else None,
-                        "金额": new_amount,
-                        "标签": new_tags if record['类型']=='支出' else None,
-                        "备注": new_note
-                    }
-                    df = update_record(df, record_index, updated_record)
-                    save_data(df)
-                    st.success("记录更新成功!")  
-                    # 显示更新后的余额
-                    # current_balance = df['余额'].iloc[-1]
-                    # st.success(f"当前余额更新为: ¥{current_balance:,.2f}")
-                    st.rerun()  # 刷新页面显示最新余额
-            
-            with col20:
-                if st.button("删除记录"):
-                    df = delete_record(df, record_index)
-                    save_data(df)
-                    st.success("记录删除成功!")
-                    st.rerun()  # 刷新页面显示最新余额
-        else:
-            st.warning("没有可编辑的记录")
-    
-    with tab2:  # 时间分析
-        st.header("时间维度分析")
-        
-        if df.empty:
-            st.warning("暂无数据")
-        else:
-            # 添加账户筛选
-            all_accounts = df['账户'].unique()
-            selected_accounts = st.multiselect("选择账户（时间分析）", options=all_accounts, default=all_accounts)
-            
-            # 筛选数据
-            time_df = df[df['账户'].isin(selected_accounts)] if selected_accounts else df
-            
-            # 搜索功能
-            col1, col2 = st.columns(2)
-            with col1:
-                # 设置时间范围
-                min_date = df["日期"].min()
-                max_date = df["日期"].max()
-                start_date, end_date = st.date_input("选择时间范围", [min_date, max_date])
-            
-            # 筛选数据
-            time_df = time_df[(time_df["日期"] >= pd.Timestamp(start_date)) & 
-                        (time_df["日期"] <= pd.Timestamp(end_date))]
-            
-            # 按时间频率分组
-            with col2:
-                freq = st.selectbox("时间频率", ["日", "周", "月",  "年"])#"季",
-            freq_map = {"日": "D", "周": "W", "月": "M",  "年": "Y"} #"季": "Q",
-            grouped = time_df.groupby([pd.Grouper(key="日期", freq=freq_map[freq]), "类型"])
-            
-            # 计算收支
-            result = grouped["金额"].sum().unstack().fillna(0)
-            result["净收入"] = result.get("收入", 0) - result.get("支出", 0)
-            
-            # 绘制图表
-            fig, ax = plt.subplots(figsize=(12, 6))
-            result[["收入", "支出"]].plot(kind="bar", ax=ax)
-            ax.set_title(f"{freq}度收支情况")
-            ax.set_ylabel("金额")
-            ax.set_xlabel("日期")
-                
-            # 设置日期显示格式
-            if freq in ["日", "周"]:
-                ax.xaxis.set_major_formatter(mpl.dates.DateFormatter('%Y-%m-%d'))
-            elif freq == "月":
-                ax.xaxis.set_major_formatter(mpl.dates.DateFormatter('%Y-%m'))
-            # elif freq == "季":
-            #     ax.xaxis.set_major_formatter(mpl.dates.DateFormatter('%Y-%q'))
-            elif freq == "年":
-                ax.xaxis.set_major_formatter(mpl.dates.DateFormatter('%Y'))
-            
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            st.pyplot(fig)
-            
-            # 显示数据
-            st.subheader("详细数据")
-            st.dataframe(result)
-    
-    with tab3:  # 分类分析
-        st.header("分类维度分析")
-        
-        if df.empty:
-            st.warning("暂无数据")
-        else:
-            # 添加账户筛选
-            all_accounts = df['账户'].unique()
-            selected_accounts = st.multiselect("选择账户（分类分析）", options=all_accounts, default=all_accounts)
-            
-            # 筛选数据
-            cat_df = df[df['账户'].isin(selected_accounts)] if selected_accounts else df
-            
-            # 选择分析类型
-            analysis_type = st.radio("分析类型", ["支出分类", "收入分类"])
-            target = "支出" if analysis_type == "支出分类" else "收入"
-            
-            # 筛选数据
-            cat_df = cat_df[cat_df["类型"] == target]
-            
-            if cat_df.empty:
-                st.warning(f"无{target}数据")
-            else:
-                # 确保分类字段没有空值
-                cat_df = cat_df.dropna(subset=["用途"])
-                
-                # 分类统计
-                category_stats = cat_df.groupby("用途")["金额"].sum().sort_values(ascending=False)
-                
-                # 检查是否有数据可展示
-                if category_stats.empty:
-                    st.warning(f"没有可用的{target}分类数据")
-                else:
-                    # 绘制饼图
-                    fig1, ax1 = plt.subplots(figsize=(8, 8))
-                    category_stats.plot(kind="pie", autopct="%1.1f%%", ax=ax1)
-                    ax1.set_title(f"{target}分类占比")
-                    ax1.set_ylabel("")
-                    st.pyplot(fig1)
-                    
-                    # 绘制条形图 - 添加错误处理
+        # 批量导入微信/支付宝/中行账单
+        with st.expander("导入账单"):
+            statement_files = st.file_uploader("微信/支付宝/中行账单(CSV或XLSX)", type=["csv", "xlsx"],
+                                               accept_multiple_files=True, key="statement_files")
+            statement_format = st.selectbox("账单格式", ["自动识别", *statement_import.FORMATS], key="statement_format")
+            skip_duplicates = st.checkbox("跳过已存在的记录", value=True, key="skip_duplicates")
+            if "import_message" in st.session_state:
+                st.success(st.session_state.pop("import_message"))
+            if statement_files and st.button("导入账单"):
+                fmt = None if statement_format == "自动识别" else statement_format
+                imported = []
+                for file in statement_files:
                     try:
-                        fig2, ax2 = plt.subplots(figsize=(10, 6))
-                        category_stats.plot(kind="bar", ax=ax2)
-                        ax2.set_title(f"{target}分类分布")
-                        ax2.set_ylabel("金额")
-                        
-                        # 设置X轴标签旋转，避免重叠
-                        plt.xticks(rotation=45, ha='right')
-                        plt.tight_layout()
-                        
-                        st.pyplot(fig2)
-                    except Exception as e:
-                        st.error(f"绘制条形图时出错: {str(e)}")
-                        st.info("可能是因为没有足够的数据来绘制图表")
-                    
-                    # 显示数据
-                    st.subheader("分类详细数据")
-                    st.dataframe(category_stats)
-    
-    with tab4:  # 标签分析
-        # st.header("标签维度分析")
-        
-        if df.empty:
-            st.warning("暂无数据")
-            return
-        
-        # 添加账户筛选
-        all_accounts = df['账户'].unique()
-        selected_accounts = st.multiselect("选择账户（标签分析）", options=all_accounts, default=all_accounts)
-        
-        # 筛选数据
-        tag_df = df[df['账户'].isin(selected_accounts)] if selected_accounts else df
-
-        # 预处理标签数据
-        tag_df = (
-            tag_df.assign(标签列表=df["标签"].str.split(" "))  # 拆分标签
-            .explode("标签列表")  # 展开标签
-            .assign(标签列表=lambda x: x["标签列表"].str.strip())  # 去除空格
-            .query("标签列表 != ''")  # 过滤空标签
-        )
-        if tag_df.empty:
-            st.warning("没有有效的标签数据")
-            return
+                        _, records = statement_import.read_statement(file, fmt)
+                    except ValueError as e:
+                        st.error(str(e))
+                        continue
+                    imported.append(records)
+                imported = [r for r in imported if not r.empty]
+                if imported:
+                    records = pd.concat(imported, ignore_index=True)
+                    # 与账本中已有记录指纹相同的视为重复
+                    duplicated = get_fingerprint_index(df).duplicated(records)
+                    message = f"已导入 {len(records) - duplicated.sum() if skip_duplicates else len(records)} 条记录"
+                    if duplicated.any():
+                        message += f"，{'跳过' if skip_duplicates else '其中'} {duplicated.sum()} 条重复记录"
+                    if skip_duplicates:
+                        records = records[~duplicated]
+                    df = add_records(df, records)
+                    st.session_state["import_message"] = message
+                    st.rerun() # 刷新显示最新余额
 
-        col100, _ , col200 = st.columns([7,0.4,7])
-
-        # with col100:
-        st.header("各标签分布")
-        # 标签分析参数设置
-        col1, col2 = st.columns(2)
-        with col1:
-            tag_type = st.radio("收支类型", ["全部", "支出", "收入"])
-        with col2:
-            min_count = st.slider("最小出现次数", 1, 20, 1)
-        
-        # 筛选数据
-        filtered_tag_df = tag_df.copy()
-        if tag_type != "全部":
-            filtered_tag_df = filtered_tag_df[filtered_tag_df["类型"] == tag_type]
-        
-        # 计算标签统计
-        tag_stats = (
-            filtered_tag_df.groupby("标签列表")["金额"]
-            .agg(["sum", "count"])
-            .query(f"count >= {min_count}")
-            .sort_values("sum", ascending=False)
-        )
-        
-        if tag_stats.empty:
-            st.warning("没有符合条件的标签数据")
-            return
-        
-        # 显示标签统计概览
-        fig, ax = plt.subplots(figsize=(12, 8))
-        tag_stats["sum"].plot(kind="bar", ax=ax)
-        ax.set_title(f"标签分析 ({tag_type})")
-        ax.set_ylabel("金额")
-        st.pyplot(fig)
-        
-        st.subheader("标签详细数据")
-        st.dataframe(tag_stats)
+        st.markdown("---")
+        st.toggle("交互式图表", key="interactive_charts", help="使用可缩放的原生图表，不生成图片")
 
-        # with col200:
-        # 标签详细分析部分
-        # st.markdown("---")
-        st.header("特定标签")
-        
-        selected_tag = st.selectbox("选择要查看的标签", tag_stats.index)
-        tag_records = filtered_tag_df[filtered_tag_df["标签列表"] == selected_tag]
-        
-        if tag_records.empty:
-            st.warning(f"没有找到标签 '{selected_tag}' 的记录")
-            return
-        
-        # 格式化显示记录
-        display_records = (
-            tag_records.assign(
-                日期=lambda x: x["日期"].dt.strftime('%Y-%m-%d'),
-                金额=lambda x: x["金额"].apply(lambda x: f"¥{x:,.2f}")
-            )
-            .fillna('')
-            .sort_values('日期', ascending=False)
-        )
-        
-        st.dataframe(display_records[["日期", "类型", "金额", "用途", "备注"]])
-        
-        # 绘制时间趋势图
-        st.subheader(f"'{selected_tag}'标签的时间趋势")
-        time_grouped = tag_records.groupby(pd.Grouper(key="日期", freq="M"))["金额"].sum()
-        
-        if len(time_grouped) > 1:
-            fig2, ax2 = plt.subplots(figsize=(12, 6))
-            time_grouped.plot(kind="line", marker="o", ax=ax2)
-            ax2.set_title(f"'{selected_tag}'标签的月度趋势")
-            ax2.set_ylabel("金额")
-            ax2.grid(True)
-            st.pyplot(fig2)
-        else:
-            st.info("数据点不足，无法显示趋势图")
+    # 主界面布局：只运行当前选中的视图，其它视图不做任何计算
+    views = {
+        "数据管理": show_manage_view,
+        "时间统计": show_time_view,
+        "分类统计": show_category_view,
+        "标签统计": show_tag_view,
+        "趋势分析": show_trend_view,
+        "预算": show_budget_view,
+    }
+    active_view = st.radio("视图", list(views), horizontal=True, key="active_view",
+                           label_visibility="collapsed")
+    with profiling.span(f"view:{active_view}"):
+        views[active_view](df)
 
-        
+    show_debug_panel(profiling.end())
 
     # # 在底部添加另一个退出按钮
     # st.markdown("---")
     # if st.button("安全退出程序", key="bottom_exit_button", help="保存数据并退出程序"):
-    #     save_data(df)  # 确保数据保存
+    #     save_data()  # 确保数据保存
     #     safe_exit()
 
 if __name__ == "__main__":
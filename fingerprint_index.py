@@ -0,0 +1,81 @@
+import pandas as pd
+
+import ledger_index
+
+# ===================== 重复记录检测 =====================
+# 每条记录按 (日期, 账户, 类型, 金额(分), 来源/用途, 备注) 生成指纹，
+# 维护 指纹 -> 序号集合 的哈希索引，随增删改更新。
+# 录入或导入时每条记录只需一次字典查找，不用扫描整本账。
+
+
+def _text(value):
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+        return ""
+    return " ".join(str(value).split())
+
+
+def fingerprint(record):
+    """单条记录的指纹；收入取来源，支出取用途"""
+    detail = record.get("来源") if record.get("类型") == "收入" else record.get("用途")
+    return (
+        pd.Timestamp(record["日期"]).normalize(),
+        record["账户"],
+        record["类型"],
+        int(record["金额"]),
+        _text(detail),
+        _text(record.get("备注")),
+    )
+
+
+def fingerprints(df):
+    """整张表的指纹（向量化生成各列，再拼成元组）"""
+    if df.empty:
+        return []
+    purposes = df["用途"].astype(object)
+    details = df["来源"].astype(object).where(df["类型"] == "收入", purposes) if "来源" in df.columns else purposes
+    notes = df["备注"] if "备注" in df.columns else pd.Series(None, index=df.index)
+    return list(zip(
+        pd.to_datetime(df["日期"]).dt.normalize().tolist(),
+        df["账户"].tolist(),
+        df["类型"].tolist(),
+        df["金额"].astype("int64").tolist(),
+        [_text(v) for v in details.tolist()],
+        [_text(v) for v in notes.tolist()],
+    ))
+
+
+class FingerprintIndex:
+    """指纹 -> 序号集合"""
+
+    def __init__(self, df):
+        self.postings = {}
+        if df.empty:
+            return
+        for record_id, key in zip(df["序号"].tolist(), fingerprints(df)):
+            self.postings.setdefault(key, set()).add(record_id)
+
+    # ---------- 增量维护 ----------
+    def on_add(self, record_id, record):
+        self.postings.setdefault(fingerprint(record), set()).add(record_id)
+
+    def on_remove(self, record_id, record):
+        key = fingerprint(record)
+        ids = self.postings.get(key)
+        if ids is not None:
+            ids.discard(record_id)
+            if not ids:
+                del self.postings[key]
+
+    # ---------- 查询 ----------
+    def duplicates_of(self, record):
+        """与该记录指纹相同的已有记录序号"""
+        key = fingerprint(record)
+        with ledger_index.locked():
+            return set(self.postings.get(key, ()))
+
+    def duplicated(self, records):
+        """批量记录中哪些已存在于账本（布尔 Series）"""
+        keys = fingerprints(records)
+        with ledger_index.locked():
+            found = [key in self.postings for key in keys]
+        return pd.Series(found, index=records.index, dtype=bool)
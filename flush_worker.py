@@ -0,0 +1,119 @@
+import atexit
+import threading
+import time
+
+# ===================== 后台落盘 =====================
+# 增删改只追加日志（已 fsync，确认即持久），合并日志和导出 Excel 交给后台线程：
+# 每次写入只标记“有未落盘的变更”，最后一次写入之后安静 delay 秒（最长不超过 max_delay）
+# 才执行一次落盘（合并日志），连续的多次点击合并成一次写入。
+# 导出整本账较慢，后台最多每隔 export_interval 秒导出一次，其余的留到安全退出或进程退出时。
+# 落盘失败时变更仍在日志中，不会丢失，稍后重试；安全退出和进程退出时同步落盘并导出。
+
+FLUSH_DELAY = 2.0      # 最后一次写入之后等待多久再落盘（秒）
+MAX_FLUSH_DELAY = 30.0  # 持续写入时最长多久落盘一次（秒）
+RETRY_DELAY = 10.0     # 落盘失败后多久重试（秒）
+EXPORT_INTERVAL = 600.0  # 后台最多每隔多久导出一次（秒）
+
+
+class FlushWorker:
+    """合并多次写入、在后台线程中执行 flush() 的落盘线程；export() 按间隔限流"""
+
+    def __init__(self, flush, export=None, delay=FLUSH_DELAY, max_delay=MAX_FLUSH_DELAY,
+                 retry_delay=RETRY_DELAY, export_interval=EXPORT_INTERVAL):
+        self._flush = flush
+        self._export = export
+        self.export_interval = export_interval
+        self.delay = delay
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.last_error = None
+        self.flush_count = 0
+        self.export_count = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # 后台落盘和同步落盘不同时进行
+        self._generation = 0   # 每标记一次变更加一
+        self._flushed = 0      # 已落盘的变更编号
+        self._first_mark = None
+        self._last_mark = None
+        self._thread = None
+        self._export_pending = False  # 落盘之后还没有导出
+        self._last_export = time.monotonic()
+        atexit.register(self._flush_at_exit)
+
+    @property
+    def dirty(self):
+        with self._cond:
+            return self._flushed < self._generation
+
+    def mark_dirty(self):
+        """记录一次已写入日志、尚未落盘的变更（立即返回）"""
+        with self._cond:
+            now = time.monotonic()
+            if self._flushed == self._generation:
+                self._first_mark = now
+            self._generation += 1
+            self._last_mark = now
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="flush-worker", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _flush_upto(self, target, force=False):
+        with self._flush_lock:
+            if self._flushed >= target and not force:
+                return
+            self._flush()
+            self.flush_count += 1
+            self.last_error = None
+            self._export_pending = True
+            with self._cond:
+                self._flushed = max(self._flushed, target)
+                self._cond.notify_all()
+
+    def _export_upto(self, force=False):
+        """有未导出的落盘时导出；不强制时距上次导出不足 export_interval 秒则跳过"""
+        with self._flush_lock:
+            if self._export is None or not self._export_pending:
+                return
+            if not force and time.monotonic() - self._last_export < self.export_interval:
+                return
+            self._export()
+            self.export_count += 1
+            self._export_pending = False
+            self._last_export = time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._flushed >= self._generation:
+                    self._cond.wait()
+                # 等到写入停下来：距最后一次写入满 delay 秒，或距第一次未落盘的写入满 max_delay 秒
+                while True:
+                    due = min(self._last_mark + self.delay, self._first_mark + self.max_delay)
+                    remaining = due - time.monotonic()
+                    if remaining <= 0 or self._flushed >= self._generation:
+                        break
+                    self._cond.wait(remaining)
+                target = self._generation
+            try:
+                self._flush_upto(target)
+                self._export_upto()
+            except Exception as e:
+                # 变更仍在日志里，稍后重试
+                self.last_error = e
+                print(f"后台落盘失败，{self.retry_delay:.0f} 秒后重试: {e}")
+                time.sleep(self.retry_delay)
+
+    def flush(self):
+        """立即同步落盘并导出（安全退出时调用），失败时抛出异常"""
+        with self._cond:
+            target = self._generation
+        self._flush_upto(target, force=True)
+        self._export_upto(force=True)
+
+    def _flush_at_exit(self):
+        if self.dirty or self._export_pending:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"退出前落盘失败（变更仍保存在日志中）: {e}")
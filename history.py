@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+import ledger_schema
+from ledger_journal import decode_record, encode_record
+from storage import STORED_COLUMNS, file_version
+
+# ===================== 撤销 / 重做 =====================
+# 每次增删改记一条操作历史，只保存受影响记录的增量：
+#   {"序号": 记录序号, "before": 修改前的字段, "after": 修改后的字段}
+# 新增时 before 为 None，删除时 after 为 None（before 为整条记录），修改只保存改动的字段。
+# 字段值与日志相同，使用存储格式（金额为元、日期为 ISO 字符串）。
+#
+# 历史文件只追加：do（新操作）、undo、redo 各一行，每一步撤销/重做都是 O(1)；
+# 启动时回放这些行重建撤销栈和重做栈。撤销栈最多保留 max_entries 步，
+# 文件行数超过上限的 COMPACT_FACTOR 倍时，按当前两个栈原子地重写文件。
+# 撤销和重做本身作为普通的增删改写入交易日志，不再需要整本账的备份副本。
+
+MAX_HISTORY = 200    # 最多可撤销的步数
+COMPACT_FACTOR = 2   # 文件行数超过 MAX_HISTORY 的多少倍时压缩
+
+
+def snapshot(record, fields):
+    """记录中指定字段的存储格式取值（金额换算成元）"""
+    return encode_record(ledger_schema.storage_record({c: record[c] for c in fields}))
+
+
+def record_snapshot(record):
+    """整条记录（不含序号和余额）的存储格式取值"""
+    return snapshot(record, [c for c in STORED_COLUMNS if c != "序号"])
+
+
+def to_memory(values):
+    """存储格式的字段转换成内存格式（日期为 Timestamp，金额为分）"""
+    values = decode_record(values)
+    if values.get("金额") is not None:
+        values["金额"] = ledger_schema.to_fen(values["金额"])
+    return values
+
+
+def invert(changes):
+    """一组变更的逆操作：交换前后取值并倒序执行"""
+    return [{"序号": c["序号"], "before": c["after"], "after": c["before"]} for c in reversed(changes)]
+
+
+def matches(record, values):
+    """记录当前的字段是否与历史中保存的取值一致"""
+    return snapshot(record, values) == values
+
+
+class EditHistory:
+    """持久化的撤销栈和重做栈"""
+
+    def __init__(self, path, max_entries=MAX_HISTORY):
+        self.path = path
+        self.max_entries = max_entries
+        self._undo = deque(maxlen=max_entries)
+        self._redo = []
+        self._lines = 0
+        self._version = None
+        self._lock = threading.RLock()
+        self._load()
+
+    # ---------- 读取 ----------
+    def _load(self):
+        self._undo.clear()
+        self._redo.clear()
+        self._lines = 0
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 崩溃时写了一半的行
+                    self._replay(event)
+                    self._lines += 1
+        self._version = file_version(self.path)
+
+    def _replay(self, event):
+        kind = event["event"]
+        if kind == "do":
+            self._undo.append({k: event[k] for k in ("label", "time", "changes")})
+            self._redo.clear()
+        elif kind == "undo" and self._undo:
+            self._redo.append(self._undo.pop())
+        elif kind == "redo" and self._redo:
+            self._undo.append(self._redo.pop())
+
+    def sync(self):
+        """其他进程写过历史文件时重新读取（调用方持有日志写锁）"""
+        with self._lock:
+            if file_version(self.path) != self._version:
+                self._load()
+
+    @property
+    def undo_label(self):
+        return self._undo[-1]["label"] if self._undo else None
+
+    @property
+    def redo_label(self):
+        return self._redo[-1]["label"] if self._redo else None
+
+    def peek_undo(self):
+        return self._undo[-1] if self._undo else None
+
+    def peek_redo(self):
+        return self._redo[-1] if self._redo else None
+
+    # ---------- 写入 ----------
+    def _append(self, event):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._replay(event)
+        self._lines += 1
+        if self._lines > self.max_entries * COMPACT_FACTOR:
+            self.compact()
+        self._version = file_version(self.path)
+
+    def record(self, label, changes):
+        """记录一次新操作（清空重做栈）"""
+        if not changes:
+            return
+        with self._lock:
+            self._append({"event": "do", "label": label,
+                          "time": datetime.now().isoformat(timespec="seconds"), "changes": changes})
+
+    def undone(self):
+        """栈顶操作已撤销"""
+        with self._lock:
+            self._append({"event": "undo"})
+
+    def redone(self):
+        """重做栈顶操作已重做"""
+        with self._lock:
+            self._append({"event": "redo"})
+
+    def compact(self):
+        """只保留当前两个栈：按 do 的顺序重写，再用 undo 行把撤销过的操作移回重做栈"""
+        with self._lock:
+            entries = list(self._undo) + self._redo[::-1]
+            lines = [{"event": "do", **entry} for entry in entries]
+            lines += [{"event": "undo"}] * len(self._redo)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for line in lines:
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._lines = len(lines)
+            self._version = file_version(self.path)
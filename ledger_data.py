@@ -0,0 +1,121 @@
+import os
+
+import ledger_index
+import ledger_schema
+import profiling
+import storage
+from balance_engine import BalanceEngine, signed_amounts
+from ledger_journal import get_journal as _get_journal
+
+# ===================== 账本读取 =====================
+# 读取账本、计算余额和常用统计，不依赖 Streamlit：
+# 界面（finance_app.py）和命令行报表（reports.py）共用这里的逻辑。
+
+# 配置文件路径
+EXCEL_FILE = "financial_records.xlsx"            # 导出/兼容用的Excel账本
+JOURNAL_FILE = "financial_records.journal"       # 追加式交易日志
+HISTORY_FILE = "financial_records.history"       # 撤销/重做历史
+BUDGET_FILE = "financial_records.budgets.json"   # 预算设置
+# 存储后端，可通过环境变量 JIZHANG_STORAGE 切换为 parquet 或 partitioned
+STORAGE_BACKEND = os.environ.get("JIZHANG_STORAGE", "sqlite")
+STORAGE_FILES = {
+    "sqlite": "financial_records.db",
+    "parquet": "financial_records.parquet",
+    "partitioned": "financial_records.parts",   # 分区目录
+}
+# 各后端的参数；分区粒度可通过环境变量 JIZHANG_PARTITION 设为 M（按月）或 Y（按年）
+STORAGE_OPTIONS = {
+    "partitioned": {"freq": os.environ.get("JIZHANG_PARTITION", "M")},
+}
+
+# 读取Excel数据（旧版账本，仅用于首次迁移）
+def load_excel():
+    if not os.path.exists(EXCEL_FILE):
+        return storage.empty_frame(), 0
+    return storage.ExcelBackend(EXCEL_FILE).read_all(), 0
+
+# 获取存储后端
+def get_storage():
+    return storage.open_storage(STORAGE_BACKEND, STORAGE_FILES[STORAGE_BACKEND],
+                                **STORAGE_OPTIONS.get(STORAGE_BACKEND, {}))
+
+# 获取交易日志
+def get_journal():
+    return _get_journal(JOURNAL_FILE, get_storage())
+
+# 从存储读取账本：快照 + 回放日志
+@profiling.profiled()
+def read_ledger(journal):
+    df, replayed = journal.load(fallback=load_excel)
+
+    # 首次运行时把Excel账本迁移到存储后端，之后不再解析Excel
+    if not journal.has_snapshot():
+        journal.write_snapshot(df, journal.seq)
+
+    # 转换成内存格式（分类列、整数分），余额按分重新累计
+    if df.empty:
+        return df
+    df = calculate_balance(ledger_schema.compact(df))
+    return index_by_id(df)
+
+# 只读取与日期范围相交的分区（分区存储）；其它存储后端读取完整账本
+# 返回的账本包含相交分区内的全部记录，余额从分区的期初余额接着累计，与完整账本一致；
+# 各账户的期初余额（分）记在 df.attrs["opening"]，窗口内没有记录的账户也在其中
+@profiling.profiled()
+def read_ledger_window(journal, start=None, end=None):
+    if not hasattr(journal.store, "read_window"):
+        return read_ledger(journal)
+    if not journal.has_snapshot():
+        read_ledger(journal)  # 首次运行：先完成迁移
+    # 先把日志合并进分区，分区中的数据和元数据才是最新的
+    journal.compact()
+    opening, df = journal.store.read_window(start, end)
+    if not df.empty:
+        df = index_by_id(calculate_balance(ledger_schema.compact(df), opening))
+    df.attrs["opening"] = opening
+    return df
+
+# 添加排序 - 按序号升序，并以序号作为行索引
+def index_by_id(df):
+    if df.empty:
+        return df
+    sorted_df = df.sort_values(by='序号', ascending=True) #
+    sorted_df.index = sorted_df['序号'].to_numpy()
+    ledger_index.carry(df, sorted_df)
+    return sorted_df
+
+# 计算余额
+@profiling.profiled()
+def calculate_balance(df, opening=None):
+    """计算并更新每笔记录的余额；opening 为各账户的期初余额（分），只读取部分账本时使用"""
+    if df.empty:
+        return df
+
+    # 确保账户列存在
+    if '账户' not in df.columns:
+        df['账户'] = '中行'  # 默认为中行账户
+
+    # 按账户、日期和序号排序，确保正确的计算顺序
+    df = df.sort_values(by=['账户', '日期', '序号'], kind='stable')
+
+    # 向量化计算每笔记录的金额变动（收入为正，支出为负）并累计余额
+    df['余额'] = signed_amounts(df).groupby(df['账户'], observed=True).cumsum()
+    if opening:
+        df['余额'] += df['账户'].astype(object).map(opening).fillna(0).astype('int64')
+
+    # 保存各账户的有序余额序列，后续增删改只重算受影响的部分
+    ledger_index.bind(df, balance=BalanceEngine.from_sorted(df))
+
+    return df
+
+# ===================== 统计 =====================
+# 分类统计：指定收支类型下各用途的金额合计（分），返回 (记录条数, 统计结果)
+# 用筛选掩码只取出金额和用途两列，不复制整本账
+def category_totals(df, target, accounts=None):
+    mask = df["类型"] == target
+    if accounts:
+        mask &= df['账户'].isin(accounts)
+    # 用途为空的记录不参与分类统计
+    stats = df["金额"][mask].groupby(df["用途"][mask], observed=True).sum().sort_values(ascending=False)
+    return int(mask.sum()), stats
+
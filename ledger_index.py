@@ -0,0 +1,79 @@
+import threading
+import weakref
+
+import profiling
+
+# ===================== 与账本同步的派生索引 =====================
+# 余额引擎、搜索索引等派生结构都挂在"最近一次同步过的 DataFrame"上。
+# 增删改时它们原地增量更新，再随新的 DataFrame 一起转交；
+# 传入的 df 不是同步过的那个对象时，全部丢弃，用到时按 df 重新构建。
+#
+# 需要随记录增删自动更新的索引实现 on_add(序号, 记录) / on_remove(序号, 记录)。
+#
+# 账本 DataFrame 按写时复制发布，旧账本保持不变；索引则是原地更新、各会话共用的。
+# 还在渲染旧账本的会话拿到的索引可能已经包含之后的增删改，
+# 按索引返回的序号取行时必须容忍序号不在本账本中（get_indexer / index.intersection），不能直接 df.loc。
+#
+# 索引由 notify_add / notify_remove 在 _lock 下原地修改，其它会话的渲染线程同时在查询。
+# 各索引的查询方法同样在 locked() 下执行，返回的结果不再引用内部结构（集合、数组），
+# 查询看到的总是某次变更完整应用之后的状态。
+
+_state = {"frame": None, "indexes": {}}
+_lock = threading.RLock()
+
+
+def locked():
+    """修改或查询共享索引时持有的锁（可重入，notify_add / notify_remove 也持有它）"""
+    return _lock
+
+
+def _synced(df):
+    ref = _state["frame"]
+    return ref is not None and ref() is df
+
+
+def bind(df, **indexes):
+    """df 从此只与给定的索引同步，其它索引作废"""
+    with _lock:
+        _state["frame"] = weakref.ref(df)
+        _state["indexes"] = dict(indexes)
+
+
+def carry(src, dst):
+    """dst 继承 src 的全部索引（两者记录相同，或索引已按变更更新过）"""
+    with _lock:
+        if _synced(src):
+            _state["frame"] = weakref.ref(dst)
+        else:
+            bind(dst)
+
+
+def get(df, name, build):
+    """取得与 df 同步的索引，没有时用 build(df) 构建"""
+    with _lock:
+        if not _synced(df):
+            bind(df)
+        index = _state["indexes"].get(name)
+        if index is None:
+            with profiling.span(f"build:{name}", rows=len(df)):
+                index = build(df)
+            _state["indexes"][name] = index
+        return index
+
+
+def notify_add(df, record_id, record):
+    """通知与 df 同步的索引：新增了一条记录"""
+    with _lock:
+        if _synced(df):
+            for index in _state["indexes"].values():
+                if hasattr(index, "on_add"):
+                    index.on_add(record_id, record)
+
+
+def notify_remove(df, record_id, record):
+    """通知与 df 同步的索引：删除了一条记录"""
+    with _lock:
+        if _synced(df):
+            for index in _state["indexes"].values():
+                if hasattr(index, "on_remove"):
+                    index.on_remove(record_id, record)
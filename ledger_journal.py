@@ -0,0 +1,232 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from file_lock import WriteLock
+from storage import apply_changes, file_version
+
+# ===================== 追加式交易日志 =====================
+# 每次添加/修改/删除只向日志文件追加一行 JSON，不再整本重写 Excel。
+# 启动时先读存储后端中的快照，再回放快照之后的日志；日志积累到一定条数后
+# 在后台线程中把这些变更按序号合并进存储后端，并截掉已合并的日志（合并期间持有写锁）。
+
+COMPACT_THRESHOLD = 200  # 日志超过多少条时触发后台合并
+
+
+def _encode(value):
+    """把记录中的值转换成可写入 JSON 的形式"""
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return pd.Timestamp(value).isoformat()
+    if hasattr(value, "item"):  # numpy 标量
+        return value.item()
+    return value
+
+
+def encode_record(data):
+    """把一条记录的各字段转换成可写入 JSON 的形式"""
+    return {k: _encode(v) for k, v in data.items()}
+
+
+def decode_record(data):
+    """把日志中的字段还原成 DataFrame 使用的类型"""
+    data = dict(data)
+    if data.get("日期") is not None:
+        data["日期"] = pd.Timestamp(data["日期"])
+    return data
+
+
+def fold_ops(ops):
+    """把一批日志操作折叠成 新增/修改/删除 三个集合，同一记录的多次操作只保留最终结果"""
+    added, changed, deleted = {}, {}, set()
+    for op in ops:
+        record_id = op["序号"]
+        if op["op"] == "add":
+            added[record_id] = decode_record(op["data"])
+        elif op["op"] == "update":
+            data = decode_record(op["data"])
+            if record_id in added:
+                added[record_id].update(data)
+            else:
+                changed.setdefault(record_id, {}).update(data)
+        elif op["op"] == "delete":
+            if added.pop(record_id, None) is None:
+                deleted.add(record_id)
+                changed.pop(record_id, None)
+    return added, changed, deleted
+
+
+def apply_ops(df, ops):
+    """把一批日志操作应用到 DataFrame 上（按序号定位记录）"""
+    if not ops:
+        return df
+    return apply_changes(df, *fold_ops(ops))
+
+
+class LedgerJournal:
+    """追加式日志 + 存储后端中的快照"""
+
+    def __init__(self, journal_path, store, compact_threshold=COMPACT_THRESHOLD):
+        self.journal_path = journal_path
+        self.store = store      # 快照所在的存储后端（见 storage.py）
+        self.compact_threshold = compact_threshold
+        self.seq = 0            # 最近一条日志的序列号
+        self.pending = 0        # 快照之后尚未合并的日志条数
+        # 写锁：同一进程的各会话以及其他进程对日志和快照的写入依次进行
+        self.lock = WriteLock(journal_path + ".lock")
+        self._compact_thread = None
+
+    # ---------- 读取 ----------
+    def has_snapshot(self):
+        return self.store.exists()
+
+    def version(self):
+        """数据版本：日志文件和存储文件的 (大小, 修改时间)，任何一次写入都会改变它"""
+        return file_version(self.journal_path), self.store.version()
+
+    def _read_snapshot(self):
+        if not self.has_snapshot():
+            return None, 0
+        return self.store.read_all(), self.store.read_seq()
+
+    def _read_ops(self):
+        """读取全部日志；崩溃时写了一半的行会被丢弃并修复文件"""
+        if not os.path.exists(self.journal_path):
+            return []
+        ops, damaged = [], False
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    ops.append(json.loads(line))
+                except json.JSONDecodeError:
+                    damaged = True
+        if damaged:
+            print(f"日志 {self.journal_path} 存在损坏的行，已跳过")
+            self._rewrite(ops)
+        return ops
+
+    def load(self, fallback=None):
+        """读取快照并回放其后的日志，返回 (DataFrame, 回放条数)
+
+        没有快照时用 fallback() 读取初始数据（例如旧的 Excel 账本），
+        它返回 (DataFrame, 该数据已包含的日志序列号)。
+        """
+        with self.lock:
+            df, snapshot_seq = self._read_snapshot()
+            if df is None:
+                df, snapshot_seq = fallback() if fallback else (pd.DataFrame(), 0)
+            ops = [op for op in self._read_ops() if op["seq"] > snapshot_seq]
+            self.seq = ops[-1]["seq"] if ops else snapshot_seq
+            self.pending = len(ops)
+        return apply_ops(df, ops), len(ops)
+
+    # ---------- 写入 ----------
+    def append(self, op, record_id, data=None):
+        """追加一条操作并落盘，返回该操作的序列号"""
+        with self.lock:
+            self.seq += 1
+            entry = {"seq": self.seq, "op": op, "序号": _encode(record_id)}
+            if data is not None:
+                entry["data"] = encode_record(data)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending += 1
+            seq = self.seq
+        if self.pending >= self.compact_threshold:
+            self.compact_async()
+        return seq
+
+    def append_many(self, op, records):
+        """批量追加同一种操作（一次写入、一次落盘），返回最后一条的序列号"""
+        with self.lock:
+            lines = []
+            for data in records:
+                self.seq += 1
+                entry = {"seq": self.seq, "op": op, "序号": _encode(data["序号"]),
+                         "data": encode_record(data)}
+                lines.append(json.dumps(entry, ensure_ascii=False) + "\n")
+            if not lines:
+                return self.seq
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending += len(lines)
+            seq = self.seq
+        if self.pending >= self.compact_threshold:
+            self.compact_async()
+        return seq
+
+    def _rewrite(self, ops):
+        """原子地用给定操作重写日志文件"""
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps(op, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    # ---------- 合并 ----------
+    def write_snapshot(self, df, seq):
+        """把完整账本写入存储后端作为快照"""
+        self.store.write_all(df, seq)
+
+    def compact(self):
+        """把快照之后的日志按序号合并进存储后端，并截掉已合并的日志
+
+        整个合并过程持有写锁（线程锁 + 锁文件）：后台合并、落盘和其他进程的合并依次进行，
+        不会有较早的合并在较晚的合并之后写入存储，把已合并的修改和序列号覆盖回旧值。
+        """
+        with self.lock:
+            if not self.has_snapshot():
+                return
+            # 在锁内重新读取快照序列号，跳过已被其他合并写入存储的操作
+            snapshot_seq = self.store.read_seq()
+            # 合并日志文件中已提交的全部操作（本对象可能还没有 load 过，不能只看 self.seq）
+            ops = [op for op in self._read_ops() if op["seq"] > snapshot_seq]
+            if not ops:
+                return
+            upto = ops[-1]["seq"]
+            self.seq = max(self.seq, upto)
+            self.store.apply(*fold_ops(ops), seq=upto)
+            remaining = [op for op in self._read_ops() if op["seq"] > upto]
+            self._rewrite(remaining)
+            self.pending = len(remaining)
+
+    def compact_async(self):
+        """在后台线程中合并日志；已有合并在进行时直接返回"""
+        with self.lock:
+            if self._compact_thread is not None and self._compact_thread.is_alive():
+                return
+            self._compact_thread = threading.Thread(target=self._compact_safely, daemon=True)
+            self._compact_thread.start()
+
+    def _compact_safely(self):
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"日志合并失败: {e}")
+
+
+# 同一进程内所有会话共用一个日志对象
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(journal_path, store):
+    """获取（必要时创建）指定路径的日志对象"""
+    key = os.path.abspath(journal_path)
+    with _journals_lock:
+        if key not in _journals:
+            _journals[key] = LedgerJournal(journal_path, store)
+        return _journals[key]
@@ -0,0 +1,119 @@
+import pandas as pd
+
+from storage import STORED_COLUMNS
+
+# ===================== 账本内存格式 =====================
+# 内存中的账本使用紧凑类型：账户/类型/用途/来源 为分类类型，序号为 int32，
+# 金额和余额以“分”为单位保存为 int64，余额累加没有浮点误差。
+# 存储后端、日志和 Excel 仍以“元”为单位；只在读写这些外部格式和界面显示时换算。
+#
+# 进程内所有会话共享同一个账本 DataFrame，发布之后不再原地修改。
+# 开启 pandas 写时复制：切片和浅拷贝共用底层数组，只有被修改的列才会复制，
+# 提交修改时在浅拷贝上写入，正在读取旧账本的会话不受影响。
+pd.set_option("mode.copy_on_write", True)
+
+CATEGORY_COLUMNS = ["账户", "类型", "用途", "来源"]
+FEN_COLUMNS = ["金额", "余额"]
+ID_DTYPE = "int32"
+
+
+def to_fen(yuan):
+    """元 -> 分（单个值）"""
+    return int(round(float(yuan) * 100))
+
+
+def yuan_to_fen(values):
+    """元 -> 分（整列）"""
+    return (pd.to_numeric(values) * 100).round().astype("int64")
+
+
+def to_yuan(fen):
+    """分 -> 元，用于显示和图表"""
+    return fen / 100
+
+
+def format_yuan(fen):
+    return f"¥{fen / 100:,.2f}"
+
+
+def record_version(record):
+    """记录内容的版本标识（不含余额），用于发现其他会话的并发修改"""
+    return hash(tuple("" if pd.isna(v) else str(v) for v in (record.get(c) for c in STORED_COLUMNS)))
+
+
+def _is_categorical(series):
+    return isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def _compact_types(df):
+    df["序号"] = df["序号"].astype(ID_DTYPE)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not _is_categorical(df[col]):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def compact(df):
+    """外部格式（元、普通字符串列）转换成内存格式；余额先置零，由调用方重新累计"""
+    df = df.copy()
+    df["金额"] = yuan_to_fen(df["金额"])
+    if "余额" in df.columns:
+        df["余额"] = 0
+    else:
+        df.insert(df.columns.get_loc("金额") + 1, "余额", 0)
+    return _compact_types(df)
+
+
+def expand(df):
+    """内存格式转换回外部格式：金额/余额换算成元，分类列还原成普通列"""
+    df = df.copy()
+    for col in FEN_COLUMNS:
+        if col in df.columns:
+            df[col] = to_yuan(df[col])
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and _is_categorical(df[col]):
+            df[col] = df[col].astype(object)
+    df["序号"] = df["序号"].astype("int64")
+    return df
+
+
+def storage_record(record):
+    """写入日志的记录（金额换算成元）"""
+    record = dict(record)
+    for col in FEN_COLUMNS:
+        if record.get(col) is not None:
+            record[col] = to_yuan(record[col])
+    return record
+
+
+def _with_categories(series, values):
+    """给分类列补上新出现的取值"""
+    if not _is_categorical(series):
+        series = series.astype("category")
+    new = pd.Index(pd.Series(values).dropna().unique()).difference(series.cat.categories)
+    return series.cat.add_categories(new) if len(new) else series
+
+
+def append_rows(df, rows):
+    """追加新行（金额已是分）并保持紧凑类型"""
+    rows = rows.copy()
+    if df.empty:
+        return _compact_types(rows)
+    df = df.copy(deep=False)
+    for col in CATEGORY_COLUMNS:
+        if col in rows.columns:
+            df[col] = _with_categories(df[col], rows[col])
+            rows[col] = pd.Categorical(rows[col], categories=df[col].cat.categories)
+    rows["序号"] = rows["序号"].astype(df["序号"].dtype)
+    if "余额" in df.columns and "余额" not in rows.columns:
+        rows["余额"] = 0  # 由调用方重算
+    return pd.concat([df, rows])
+
+
+def set_values(df, index, values):
+    """修改 df 中的一行（调用方传入浅拷贝，只复制被修改的列），新出现的分类取值先加入分类"""
+    for col, value in values.items():
+        if col in df.columns and _is_categorical(df[col]) and not pd.isna(value):
+            df[col] = _with_categories(df[col], [value])
+        df.loc[index, col] = value
+    return df
@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+import pandas as pd
+
+# ===================== 性能剖析 =====================
+# 每次运行脚本（rerun）记录一组计时片段：名称、开始时间、耗时、嵌套层级、
+# 处理的行数和内存（RSS）变化。未开启时 span() 返回共用的空对象，
+# profiled() 包装的函数只多一次线程局部变量查询，几乎没有开销。
+# 记录可以导出为 Chrome trace（chrome://tracing 或 Perfetto 打开）或逐行 JSON 日志；
+# 设置环境变量 JIZHANG_TRACE_LOG 时，每次运行的记录还会追加写入该文件。
+
+TRACE_LOG = os.environ.get("JIZHANG_TRACE_LOG")
+
+_local = threading.local()
+
+
+def _rss_bytes():
+    """当前进程的常驻内存；无法获取时返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def _rows(result):
+    """从返回值中推断处理的行数"""
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return len(result)
+    return None
+
+
+class Trace:
+    """一次运行中记录的全部片段"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.depth = 0
+        self.spans = []
+
+    def total_ms(self):
+        return (time.perf_counter() - self.origin) * 1000
+
+    def to_frame(self):
+        """按开始时间排序的片段表，名称按层级缩进"""
+        frame = pd.DataFrame(self.spans, columns=["name", "depth", "start_ms", "duration_ms", "rows", "memory_mb"])
+        frame = frame.sort_values("start_ms", kind="stable").reset_index(drop=True)
+        frame["name"] = ["  " * d + n for d, n in zip(frame["depth"], frame["name"])]
+        return frame.drop(columns="depth")
+
+    def events(self, pid=0):
+        """Chrome trace 格式的事件（时间单位为微秒）"""
+        base = self.started * 1e6
+        return [{
+            "name": span["name"],
+            "ph": "X",
+            "ts": base + span["start_ms"] * 1000,
+            "dur": span["duration_ms"] * 1000,
+            "pid": pid,
+            "tid": 0,
+            "args": {k: span[k] for k in ("rows", "memory_mb") if span[k] is not None} | span["attrs"],
+        } for span in self.spans]
+
+    def log_lines(self):
+        """逐行 JSON 日志"""
+        started = pd.Timestamp(self.started, unit="s").isoformat()
+        return [json.dumps({"trace": self.name, "started": started, **span}, ensure_ascii=False, default=str)
+                for span in self.spans]
+
+
+class _Span:
+    __slots__ = ("trace", "name", "attrs", "start", "rss", "depth")
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.depth = self.trace.depth
+        self.trace.depth += 1
+        self.rss = _rss_bytes()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        rss = _rss_bytes()
+        self.trace.depth -= 1
+        rows = self.attrs.pop("rows", None)
+        self.trace.spans.append({
+            "name": self.name,
+            "depth": self.depth,
+            "start_ms": round((self.start - self.trace.origin) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "rows": rows,
+            "memory_mb": round((rss - self.rss) / 1024 / 1024, 2) if rss is not None and self.rss is not None else None,
+            "attrs": self.attrs,
+        })
+
+
+class _NoopSpan:
+    """未开启剖析时使用的空片段"""
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def begin(enabled, name="rerun"):
+    """开始记录本线程的一次运行；enabled 为 False 时关闭记录"""
+    _local.trace = Trace(name) if enabled else None
+
+
+def end():
+    """结束记录，返回本次运行的 Trace（未开启时为 None）"""
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    if trace is not None and TRACE_LOG:
+        with open(TRACE_LOG, "a", encoding="utf-8") as f:
+            f.writelines(line + "\n" for line in trace.log_lines())
+    return trace
+
+
+def span(name, **attrs):
+    """计时片段：with span("名称", rows=...) as s: ...；s.set(rows=...) 可在执行后补充属性"""
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name, attrs)
+
+
+def profiled(name=None):
+    """给函数加上计时片段，行数从返回的 DataFrame 推断"""
+    def decorator(fn):
+        label = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, "trace", None) is None:
+                return fn(*args, **kwargs)
+            with span(label) as s:
+                result = fn(*args, **kwargs)
+                s.set(rows=_rows(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def chrome_trace(traces):
+    """把多次运行合并成一个 Chrome trace 文档"""
+    events = []
+    for i, trace in enumerate(traces):
+        events.append({"name": "process_name", "ph": "M", "pid": i, "args": {"name": trace.name}})
+        events.extend(trace.events(pid=i))
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -0,0 +1,317 @@
+import argparse
+import base64
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import pandas as pd
+
+import charts
+import ledger_index
+import ledger_schema
+from balance_engine import BalanceEngine
+from ledger_data import category_totals, get_journal, read_ledger, read_ledger_window
+from rollup import DailyRollup, period_labels
+from tag_index import TagIndex
+
+# ===================== 命令行报表 =====================
+# 不启动 Streamlit，直接读取账本，为每个时间段 × 每个账户（以及全部账户合计）生成报表：
+# 期初/期末余额、收支明细、支出用途构成、标签统计和对应的图表，输出 HTML / PNG / PDF。
+# 主进程只读取账本、切分数据和查询期初/期末余额，各份报表的统计和绘图分发到进程池并行完成。
+# 统计沿用界面的逻辑（DailyRollup、category_totals、TagIndex），结果与各分析视图一致。
+#
+# 用法（在账本文件所在目录运行）:
+#   python reports.py                                  # 按月生成全部报表到 reports/
+#   python reports.py --period year --formats html pdf -o out
+#   python reports.py --accounts 中行 微信 --start 2024-01 --end 2024-12 -j 8
+
+PERIODS = {"month": "M", "quarter": "Q", "year": "Y"}
+PERIOD_NAMES = {"month": "月", "quarter": "季", "year": "年"}
+# 报表内收支明细的粒度：月报按日，季报和年报按月
+DETAIL_FREQ = {"month": "D", "quarter": "ME", "year": "ME"}
+FORMATS = ["html", "png", "pdf"]
+ALL_ACCOUNTS = "全部账户"
+TOP_TAGS = 20  # 标签统计只列出金额最大的若干个
+
+
+# ---------- 切分任务（主进程） ----------
+def _file_name(text):
+    return str(text).replace(os.sep, "_").replace("/", "_")
+
+
+def plan_reports(df, period="month", accounts=None, start=None, end=None, output="reports", formats=FORMATS):
+    """按 时间段 × 账户 切分出报表任务；每个任务只带上自己那部分记录"""
+    periods = df["日期"].dt.to_period(PERIODS[period])
+    selected = sorted(periods.unique())
+    if start is not None:
+        selected = [p for p in selected if p.end_time >= pd.Timestamp(start)]
+    if end is not None:
+        selected = [p for p in selected if p.start_time <= pd.Timestamp(end)]
+
+    # 只读取部分分区时，窗口内没有记录、但有余额的账户也要计入（余额即期初余额）
+    window_opening = {a: v for a, v in df.attrs.get("opening", {}).items() if v}
+    all_accounts = sorted(set(df['账户'].unique().tolist()) | set(window_opening))
+    accounts = [a for a in accounts if a in all_accounts] if accounts else all_accounts
+    scopes = [(account, [account]) for account in accounts]
+    if len(accounts) > 1:
+        scopes.insert(0, (ALL_ACCOUNTS, accounts))
+
+    # 期初/期末余额由余额引擎按日期二分查找
+    engine = ledger_index.get(df, "balance", BalanceEngine)
+
+    tasks = []
+    parts = dict(iter(df.groupby(periods, sort=False)))
+    for p in selected:
+        part = parts[p]
+        opening = {**window_opening, **engine.balances_as_of(p.start_time - pd.Timedelta(days=1))}
+        closing = {**window_opening, **engine.balances_as_of(p.end_time)}
+        directory = os.path.join(output, str(p))
+        os.makedirs(directory, exist_ok=True)
+        for scope, members in scopes:
+            rows = part[part['账户'].isin(members)]
+            if rows.empty:
+                continue
+            tasks.append({
+                "scope": scope,
+                "period": str(p),
+                "title": f"{scope} {p} {PERIOD_NAMES[period]}报",
+                "detail_freq": DETAIL_FREQ[period],
+                "rows": rows,
+                "balances": {a: (opening.get(a, 0), closing.get(a, 0)) for a in members},
+                "path": os.path.join(directory, _file_name(scope)),
+                "formats": list(formats),
+            })
+    return tasks
+
+
+# ---------- 统计与绘图（工作进程） ----------
+def summarize(task):
+    """一份报表的各项统计，金额换算成元"""
+    rows = task["rows"]
+
+    balances = pd.DataFrame(
+        [(a, opening, closing) for a, (opening, closing) in task["balances"].items()],
+        columns=["账户", "期初余额", "期末余额"],
+    ).set_index("账户")
+    if len(balances) > 1:
+        balances.loc["合计"] = balances.sum()
+    balances["变动"] = balances["期末余额"] - balances["期初余额"]
+
+    freq = task["detail_freq"]
+    detail = DailyRollup(rows).period_totals(freq)
+    detail.index = period_labels(detail.index, freq)
+
+    _, categories = category_totals(rows, "支出")
+    tags = TagIndex(rows).stats().head(TOP_TAGS).rename(columns={"sum": "金额", "count": "次数"})
+
+    return {
+        "余额": ledger_schema.to_yuan(balances),
+        "收支明细": ledger_schema.to_yuan(detail),
+        "支出用途": ledger_schema.to_yuan(categories).to_frame("金额"),
+        "标签统计": tags.assign(金额=ledger_schema.to_yuan(tags["金额"])),
+        "收入合计": ledger_schema.to_yuan(detail["收入"].sum()),
+        "支出合计": ledger_schema.to_yuan(detail["支出"].sum()),
+    }
+
+
+def chart_specs(task, sections):
+    """报表中的图表：(名称, draw(fig, ax), 尺寸)，与分析视图的画法一致"""
+    detail, categories, tags = sections["收支明细"], sections["支出用途"]["金额"], sections["标签统计"]
+
+    def draw_detail(fig, ax):
+        detail[["收入", "支出"]].plot(kind="bar", ax=ax)
+        ax.set_title(f"{task['title']} 收支情况")
+        ax.set_ylabel("金额")
+        ax.set_xlabel("日期")
+        ax.tick_params(axis="x", labelrotation=45)
+        fig.tight_layout()
+
+    def draw_categories(fig, ax):
+        categories.plot(kind="pie", autopct="%1.1f%%", ax=ax)
+        ax.set_title(f"{task['title']} 支出分类占比")
+        ax.set_ylabel("")
+
+    def draw_tags(fig, ax):
+        tags["金额"].plot(kind="bar", ax=ax)
+        ax.set_title(f"{task['title']} 标签统计")
+        ax.set_ylabel("金额")
+        for label in ax.get_xticklabels():
+            label.set(rotation=45, ha='right')
+        fig.tight_layout()
+
+    specs = [("收支", draw_detail, (12, 6))]
+    if not categories.empty:
+        specs.append(("用途", draw_categories, (8, 8)))
+    if not tags.empty:
+        specs.append(("标签", draw_tags, (12, 6)))
+    return specs
+
+
+def _cells(frame):
+    return [[f"{v:,.2f}" if isinstance(v, float) else str(v) for v in row] for row in frame.itertuples(index=False)]
+
+
+def _summary_page(task, sections):
+    """PDF 首页：标题、收支合计以及余额、收支明细和用途表格"""
+    tables = [(name, sections[name]) for name in ("余额", "收支明细", "支出用途") if not sections[name].empty]
+    fig = charts.new_figure((8.27, 11.69))  # A4
+    fig.suptitle(task["title"], fontsize=16)
+    fig.text(0.5, 0.93, f"收入 ¥{sections['收入合计']:,.2f}    支出 ¥{sections['支出合计']:,.2f}",
+             ha="center", fontsize=11)
+    axes = fig.subplots(len(tables), 1, gridspec_kw={"height_ratios": [len(t) + 2 for _, t in tables]},
+                        squeeze=False)[:, 0]
+    for ax, (name, frame) in zip(axes, tables):
+        ax.axis("off")
+        ax.set_title(name, loc="left", fontsize=11)
+        table = ax.table(cellText=_cells(frame), colLabels=list(frame.columns),
+                         rowLabels=[str(i) for i in frame.index], loc="upper center")
+        table.auto_set_font_size(False)
+        table.set_fontsize(7)
+    fig.subplots_adjust(top=0.9, bottom=0.03, left=0.2, right=0.95)
+    return fig
+
+
+def _html_table(frame):
+    return frame.to_html(float_format=lambda v: f"{v:,.2f}", border=0, classes="table")
+
+
+def _write_html(path, task, sections, images):
+    """HTML 报表：表格 + 图表（有 PNG 文件时引用文件，否则内嵌）"""
+    parts = [
+        f"<h1>{html.escape(task['title'])}</h1>",
+        f"<p>收入 ¥{sections['收入合计']:,.2f}　支出 ¥{sections['支出合计']:,.2f}</p>",
+    ]
+    for name in ("余额", "收支明细", "支出用途", "标签统计"):
+        if not sections[name].empty:
+            parts.append(f"<h2>{name}</h2>{_html_table(sections[name])}")
+    for src in images:
+        parts.append(f'<p><img src="{src}" style="max-width:100%"></p>')
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(HTML_TEMPLATE.format(title=html.escape(task["title"]), body="\n".join(parts)))
+
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="zh"><head><meta charset="utf-8"><title>{title}</title>
+<style>body{{font-family:sans-serif;max-width:1000px;margin:auto}}
+.table{{border-collapse:collapse}}.table td,.table th{{padding:2px 10px;text-align:right}}</style>
+</head><body>
+{body}
+</body></html>
+"""
+
+
+def render_report(task):
+    """生成一份报表，返回写出的文件路径（在工作进程中运行）"""
+    sections = summarize(task)
+    formats, path = task["formats"], task["path"]
+    written, images = [], []
+
+    pdf = None
+    if "pdf" in formats:
+        from matplotlib.backends.backend_pdf import PdfPages
+        pdf = PdfPages(path + ".pdf")
+    try:
+        if pdf is not None:
+            page = _summary_page(task, sections)
+            pdf.savefig(page)
+            page.clear()
+        for name, draw, figsize in chart_specs(task, sections):
+            fig = charts.new_figure(figsize)
+            try:
+                draw(fig, fig.subplots())
+                if pdf is not None:
+                    pdf.savefig(fig)
+                if "png" in formats:
+                    png_path = f"{path}_{name}.png"
+                    fig.savefig(png_path, format="png")
+                    written.append(png_path)
+                    images.append(os.path.basename(png_path))
+                elif "html" in formats:
+                    buffer = BytesIO()
+                    fig.savefig(buffer, format="png")
+                    images.append("data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode())
+            finally:
+                # 立即释放图形占用的内存
+                fig.clear()
+    finally:
+        if pdf is not None:
+            pdf.close()
+            written.append(path + ".pdf")
+
+    if "html" in formats:
+        _write_html(path + ".html", task, sections, images)
+        written.append(path + ".html")
+    return written
+
+
+# ---------- 调度 ----------
+def generate(tasks, workers=None):
+    """在进程池中生成全部报表，返回每份报表写出的文件"""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        return [render_report(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        return list(pool.map(render_report, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+
+def write_index(output, tasks, results):
+    """报表目录页：每个时间段一行，每个账户一列"""
+    links = {}
+    for task, files in zip(tasks, results):
+        # 优先链接 HTML，其次 PDF
+        preferred = sorted(files, key=lambda f: (not f.endswith(".html"), not f.endswith(".pdf")))
+        if preferred:
+            links[(task["period"], task["scope"])] = os.path.relpath(preferred[0], output)
+    scopes = list(dict.fromkeys(task["scope"] for task in tasks))
+    periods = list(dict.fromkeys(task["period"] for task in tasks))
+    rows = ["<tr><th></th>" + "".join(f"<th>{html.escape(s)}</th>" for s in scopes) + "</tr>"]
+    for p in periods:
+        cells = "".join(
+            f'<td><a href="{html.escape(links[(p, s)])}">{html.escape(p)}</a></td>' if (p, s) in links else "<td></td>"
+            for s in scopes
+        )
+        rows.append(f"<tr><th>{html.escape(p)}</th>{cells}</tr>")
+    path = os.path.join(output, "index.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(HTML_TEMPLATE.format(title="账本报表", body=f"<h1>账本报表</h1><table class='table'>{''.join(rows)}</table>"))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成账本报表（不启动 Streamlit）")
+    parser.add_argument("-o", "--output", default="reports", help="输出目录")
+    parser.add_argument("--period", choices=list(PERIODS), default="month", help="报表周期")
+    parser.add_argument("--accounts", nargs="+", help="只生成这些账户（默认全部账户及合计）")
+    parser.add_argument("--start", help="起始日期，如 2024-01")
+    parser.add_argument("--end", help="结束日期，如 2024-12")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=FORMATS)
+    parser.add_argument("-j", "--workers", type=int, default=None, help="并行进程数（默认 CPU 核数）")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.start or args.end:
+        # 分区存储只读取相交的分区；范围扩展到完整的报表周期
+        freq = PERIODS[args.period]
+        df = read_ledger_window(
+            get_journal(),
+            pd.Period(args.start, freq).start_time if args.start else None,
+            pd.Period(args.end, freq).end_time if args.end else None,
+        )
+    else:
+        df = read_ledger(get_journal())
+    if df.empty:
+        print("账本为空，没有可生成的报表")
+        return
+    tasks = plan_reports(df, args.period, args.accounts, args.start, args.end, args.output, args.formats)
+    if not tasks:
+        print("所选范围内没有记录")
+        return
+    results = generate(tasks, args.workers)
+    index = write_index(args.output, tasks, results)
+    print(f"已生成 {len(tasks)} 份报表、{sum(map(len, results))} 个文件，用时 {time.perf_counter() - started:.1f} 秒：{index}")
+
+
+if __name__ == "__main__":
+    main()
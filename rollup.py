@@ -0,0 +1,96 @@
+import pandas as pd
+
+import ledger_index
+
+# ===================== 时间统计汇总 =====================
+# 维护 日 × 账户 × 类型 的金额汇总，增删改记录时按差额更新对应的格子。
+# 周/月/季/年视图由日汇总再聚合得到，切换频率或日期范围时只需处理
+# 汇总表（天数 × 账户数 × 2 行），不再扫描原始账本。
+# 汇总表由索引锁下取得的格子快照生成，期间有增删改（代数变化）时不缓存。
+
+FREQ_MAP = {"日": "D", "周": "W", "月": "ME", "季": "QE", "年": "YE"}
+
+# 各频率下时间标签的显示格式
+LABEL_FORMATS = {"D": "%Y-%m-%d", "W": "%Y-%m-%d", "ME": "%Y-%m", "YE": "%Y"}
+
+CUBE_KEYS = ["日期", "账户", "类型"]
+
+
+def _key(record):
+    return pd.Timestamp(record["日期"]).normalize(), record["账户"], record["类型"]
+
+
+def period_labels(index, freq):
+    """把分组后的时间索引转换成便于展示的文字标签"""
+    if freq == "QE":
+        return index.to_period("Q").astype(str)
+    return index.strftime(LABEL_FORMATS[freq])
+
+
+class DailyRollup:
+    """日 × 账户 × 类型 的金额汇总"""
+
+    def __init__(self, df):
+        self.cells = {}
+        self._frame = None
+        self._generation = 0  # 每次增删改加一
+        if not df.empty:
+            sums = df.groupby([df["日期"].dt.normalize(), "账户", "类型"], observed=True)["金额"].sum()
+            self.cells = sums.to_dict()
+
+    # ---------- 增量维护 ----------
+    def _change(self, key, delta):
+        value = self.cells.get(key, 0) + delta
+        if value == 0:
+            self.cells.pop(key, None)
+        else:
+            self.cells[key] = value
+        self._frame = None
+        self._generation += 1
+
+    def on_add(self, record_id, record):
+        self._change(_key(record), record["金额"])
+
+    def on_remove(self, record_id, record):
+        self._change(_key(record), -record["金额"])
+
+    # ---------- 查询 ----------
+    def frame(self):
+        """汇总表：日期/账户/类型/金额，按日期排序"""
+        with ledger_index.locked():
+            if self._frame is not None:
+                return self._frame
+            generation = self._generation
+            cells = list(self.cells.items())
+        if cells:
+            keys, amounts = zip(*cells)
+            index = pd.MultiIndex.from_tuples(keys, names=CUBE_KEYS)
+            frame = pd.Series(amounts, index=index, name="金额").reset_index()
+            frame = frame.sort_values("日期", kind="stable").reset_index(drop=True)
+        else:
+            frame = pd.DataFrame({
+                "日期": pd.to_datetime([]), "账户": [], "类型": [], "金额": [],
+            })
+        with ledger_index.locked():
+            if self._generation == generation:
+                self._frame = frame
+        return frame
+
+    def period_totals(self, freq, start=None, end=None, accounts=None):
+        """按频率汇总收入、支出和净收入，每个时间段一行"""
+        cube = self.frame()
+        # 汇总表按日期有序，日期范围用二分查找截取
+        lo = 0 if start is None else cube["日期"].searchsorted(pd.Timestamp(start), side="left")
+        hi = len(cube) if end is None else cube["日期"].searchsorted(pd.Timestamp(end), side="right")
+        cube = cube.iloc[lo:hi]
+        if accounts is not None:
+            cube = cube[cube["账户"].isin(list(accounts))]
+
+        result = (
+            cube.groupby([pd.Grouper(key="日期", freq=freq), "类型"])["金额"].sum()
+            .unstack(fill_value=0)
+            .reindex(columns=["收入", "支出"], fill_value=0)
+        )
+        result["净收入"] = result["收入"] - result["支出"]
+        result.columns.name = None
+        return result
@@ -0,0 +1,136 @@
+import pandas as pd
+
+import ledger_index
+
+# ===================== 关键词搜索索引 =====================
+# 对 来源/用途/标签/备注/账户 建立字符一元、二元片段（中文按字）的倒排索引。
+# 搜索时先用片段的倒排表求交集得到候选记录，再只对候选做子串校验，
+# 结果与逐行 str.contains 一致，但不必扫描整本账。
+#
+# 搜索语法：
+#   午餐 超市        同时包含（AND）
+#   午餐 OR 晚餐     包含任意一组（也可用 |）
+#   标签:旅游        只在指定字段中查找
+
+SEARCH_FIELDS = ["来源", "用途", "标签", "备注", "账户"]
+
+
+def _normalize(value):
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+        return ""
+    return str(value).lower()
+
+
+def _grams(text):
+    """文本的全部一元和二元片段"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def _query_grams(term):
+    """查询词需要命中的片段：单字用一元，多字用全部二元"""
+    if len(term) == 1:
+        return {term}
+    return {term[i:i + 2] for i in range(len(term) - 1)}
+
+
+def parse_query(query):
+    """解析搜索语句，返回 [[(字段或None, 词), ...], ...]：组内 AND，组间 OR"""
+    groups, current = [], []
+    for token in query.split():
+        if token.upper() == "OR" or token == "|":
+            if current:
+                groups.append(current)
+            current = []
+            continue
+        field, term = None, token
+        for sep in (":", "："):
+            name, found, rest = token.partition(sep)
+            if found and name in SEARCH_FIELDS and rest:
+                field, term = name, rest
+                break
+        current.append((field, term.lower()))
+    if current:
+        groups.append(current)
+    return groups
+
+
+class SearchIndex:
+    """按字段维护的 片段 -> 序号集合 倒排表"""
+
+    def __init__(self, df):
+        self.postings = {field: {} for field in SEARCH_FIELDS}
+        self.texts = {field: {} for field in SEARCH_FIELDS}
+        if df.empty:
+            return
+        ids = df['序号'].tolist()
+        for field in SEARCH_FIELDS:
+            if field not in df.columns:
+                continue
+            for record_id, value in zip(ids, df[field].tolist()):
+                self._add_text(field, record_id, _normalize(value))
+
+    def _add_text(self, field, record_id, text):
+        if not text:
+            return
+        self.texts[field][record_id] = text
+        postings = self.postings[field]
+        for gram in _grams(text):
+            postings.setdefault(gram, set()).add(record_id)
+
+    # ---------- 增量维护 ----------
+    def on_add(self, record_id, record):
+        for field in SEARCH_FIELDS:
+            self._add_text(field, record_id, _normalize(record.get(field)))
+
+    def on_remove(self, record_id, record):
+        for field in SEARCH_FIELDS:
+            text = self.texts[field].pop(record_id, None)
+            if text is None:
+                continue
+            postings = self.postings[field]
+            for gram in _grams(text):
+                ids = postings.get(gram)
+                if ids is not None:
+                    ids.discard(record_id)
+                    if not ids:
+                        del postings[gram]
+
+    # ---------- 查询 ----------
+    def _match_field(self, field, term):
+        postings = self.postings[field]
+        sets = [postings.get(gram) for gram in _query_grams(term)]
+        if any(s is None for s in sets):
+            return set()
+        sets.sort(key=len)
+        candidates = set(sets[0]).intersection(*sets[1:])
+        # 二元片段都命中不代表连续出现，对候选做一次子串校验
+        texts = self.texts[field]
+        return {i for i in candidates if term in texts.get(i, "")}
+
+    def match(self, field, term):
+        """包含 term 的记录序号；field 为 None 时在全部字段中查找"""
+        fields = SEARCH_FIELDS if field is None else [field]
+        result = set()
+        with ledger_index.locked():
+            for name in fields:
+                result |= self._match_field(name, term)
+        return result
+
+    def search(self, query):
+        """按搜索语句返回命中的序号集合；空查询返回 None（不筛选）"""
+        groups = parse_query(query)
+        if not groups:
+            return None
+        result = set()
+        with ledger_index.locked():
+            for group in groups:
+                ids = None
+                for field, term in group:
+                    matched = self.match(field, term)
+                    ids = matched if ids is None else ids & matched
+                    if not ids:
+                        break
+                result |= ids
+        return result
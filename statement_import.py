@@ -0,0 +1,213 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from ledger_schema import yuan_to_fen
+
+# ===================== 账单批量导入 =====================
+# 逐块读取微信/支付宝/中行导出的账单（CSV 或 XLSX），映射成账本的
+# 日期/类型/账户/金额(分)/来源/用途/标签/备注 列。读取按块进行，内存占用与文件大小无关；
+# 序号分配、余额计算和写入由调用方对整批记录一次完成。
+
+CHUNK_SIZE = 5000
+HEADER_SCAN_LINES = 60  # 账单表头之前通常有若干行说明文字
+
+# 各账单格式的列名对应关系
+FORMATS = {
+    "微信": {
+        "account": "微信",
+        "header": ["交易时间", "收/支", "金额(元)"],
+        "date": "交易时间",
+        "direction": "收/支",
+        "amount": "金额(元)",
+        "counterparty": "交易对方",
+        "item": "商品",
+        "status": "当前状态",
+        "note": "备注",
+    },
+    "支付宝": {
+        "account": "支付宝",
+        "header": ["交易时间", "收/支", "金额"],
+        "date": "交易时间",
+        "direction": "收/支",
+        "amount": "金额",
+        "counterparty": "交易对方",
+        "item": "商品说明",
+        "status": "交易状态",
+        "category": "交易分类",
+        "note": "备注",
+    },
+    "中行": {
+        # 银行流水没有收/支列，金额带正负号
+        "account": "中行",
+        "header": ["记账日期", "金额"],
+        "date": "记账日期",
+        "amount": "金额",
+        "counterparty": "对方账户名",
+        "item": "交易名称",
+        "note": "附言",
+    },
+}
+
+# 这些状态的交易没有实际发生资金变动
+SKIPPED_STATUS = {"已全额退款", "对方已退还", "交易关闭", "退款成功", "已退款"}
+
+# 支付宝交易分类 -> 用途
+CATEGORY_MAP = {
+    "餐饮美食": "吃饭",
+    "交通出行": "交通",
+    "日用百货": "购物",
+    "服饰装扮": "购物",
+    "数码电器": "网购",
+    "文化休闲": "娱乐",
+    "住房物业": "住房",
+    "医疗健康": "医疗",
+    "教育培训": "教育",
+    "充值缴费": "月度",
+}
+
+
+def _source_name(source):
+    return getattr(source, "name", source if isinstance(source, str) else "")
+
+
+def _read_head(source, size=64 * 1024):
+    """读取文件开头的字节用于识别格式，不影响之后的读取位置"""
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read(size)
+    head = source.read(size)
+    source.seek(0)
+    return head
+
+
+def _match_format(cells, fmt=None):
+    """判断一行是否是账单表头，返回匹配的格式名称"""
+    cells = {str(c).strip() for c in cells if c is not None}
+    names = [fmt] if fmt else list(FORMATS)
+    for name in names:
+        if all(col in cells for col in FORMATS[name]["header"]):
+            return name
+    return None
+
+
+def _detect_csv(source, fmt=None):
+    """找出 CSV 账单的编码、表头所在行和格式"""
+    head = _read_head(source)
+    for encoding in ("utf-8-sig", "gb18030"):
+        try:
+            text = head.decode(encoding)
+        except UnicodeDecodeError:
+            # 截断处可能切在多字节字符中间，去掉最后一行再试
+            try:
+                text = head[:head.rfind(b"\n")].decode(encoding)
+            except UnicodeDecodeError:
+                continue
+        for line_no, line in enumerate(text.splitlines()[:HEADER_SCAN_LINES]):
+            name = _match_format(line.split(","), fmt)
+            if name:
+                return encoding, line_no, name
+    raise ValueError(f"无法识别账单格式: {_source_name(source)}")
+
+
+def _csv_chunks(source, fmt=None, chunksize=CHUNK_SIZE):
+    encoding, header_line, name = _detect_csv(source, fmt)
+    reader = pd.read_csv(
+        source, encoding=encoding, skiprows=header_line, dtype=str,
+        chunksize=chunksize, on_bad_lines="skip", skipinitialspace=True,
+    )
+    return name, reader
+
+
+def _xlsx_chunks(source, fmt=None, chunksize=CHUNK_SIZE):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    for _, cells in zip(range(HEADER_SCAN_LINES), rows):
+        name = _match_format(cells, fmt)
+        if name:
+            columns = [str(c).strip() if c is not None else "" for c in cells]
+            break
+    else:
+        workbook.close()
+        raise ValueError(f"无法识别账单格式: {_source_name(source)}")
+
+    def chunks():
+        try:
+            batch = []
+            for cells in rows:
+                batch.append(cells)
+                if len(batch) >= chunksize:
+                    yield pd.DataFrame(batch, columns=columns, dtype=str)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=columns, dtype=str)
+        finally:
+            workbook.close()
+
+    return name, chunks()
+
+
+def read_chunks(source, fmt=None, chunksize=CHUNK_SIZE):
+    """逐块读取账单，返回 (格式名称, 原始数据块迭代器)；fmt 为空时自动识别"""
+    if os.path.splitext(_source_name(source))[1].lower() in (".xlsx", ".xlsm"):
+        return _xlsx_chunks(source, fmt, chunksize)
+    return _csv_chunks(source, fmt, chunksize)
+
+
+def map_chunk(chunk, fmt):
+    """把一块原始账单映射成账本的列，去掉无效、退款和不计收支的行"""
+    spec = FORMATS[fmt]
+    chunk = chunk.rename(columns=lambda c: str(c).strip())
+
+    def column(key):
+        name = spec.get(key)
+        if name is None or name not in chunk.columns:
+            return pd.Series("", index=chunk.index)
+        return chunk[name].fillna("").astype(str).str.strip()
+
+    amounts = pd.to_numeric(column("amount").str.replace(r"[¥￥,\s]", "", regex=True), errors="coerce")
+    if "direction" in spec:
+        types = column("direction").map({"支出": "支出", "收入": "收入"})
+    else:
+        types = pd.Series(np.where(amounts >= 0, "收入", "支出"), index=chunk.index)
+    dates = pd.to_datetime(column("date"), errors="coerce").dt.normalize()
+
+    keep = types.notna() & amounts.notna() & (amounts != 0) & dates.notna()
+    if "status" in spec:
+        keep &= ~column("status").isin(SKIPPED_STATUS)
+
+    counterparty = column("counterparty").replace("/", "")
+    if "category" in spec:
+        purposes = column("category").map(CATEGORY_MAP).fillna("其他")
+    else:
+        purposes = pd.Series("其他", index=chunk.index)
+    is_income = types == "收入"
+    # 支出的交易对方（商户）记在备注里
+    payee = counterparty.where(~is_income, "")
+    notes = (payee + " " + column("item").replace("/", "") + " " + column("note").replace("/", ""))
+    notes = notes.str.split().str.join(" ")
+
+    records = pd.DataFrame({
+        "日期": dates,
+        "类型": types,
+        "账户": spec["account"],
+        "金额": amounts.abs().fillna(0).pipe(yuan_to_fen),
+        "来源": counterparty.where(is_income, None),
+        "用途": purposes.where(~is_income, None),
+        "标签": None,
+        "备注": notes.where(notes != "", None),
+    })
+    return records[keep]
+
+
+def read_statement(source, fmt=None, chunksize=CHUNK_SIZE):
+    """读取整份账单并映射成账本记录（按块处理），返回 (格式名称, 记录)"""
+    name, chunks = read_chunks(source, fmt, chunksize)
+    mapped = [map_chunk(chunk, name) for chunk in chunks]
+    mapped = [m for m in mapped if not m.empty]
+    if not mapped:
+        return name, map_chunk(pd.DataFrame(), name)
+    return name, pd.concat(mapped, ignore_index=True)
@@ -0,0 +1,497 @@
+import json
+import os
+import sqlite3
+import sys
+from contextlib import closing
+
+import pandas as pd
+
+# ===================== 存储后端 =====================
+# 账本的持久化格式可插拔：
+#   sqlite  - 内置 SQLite，按序号主键做单点增删改，按 日期/账户 建索引做范围读取
+#   parquet - 列式存储（需要 pyarrow），按日期排序写入，范围读取时按行组裁剪
+#   partitioned - 按月或按年分区的 Parquet 目录（需要 pyarrow），清单记录各分区的日期范围、
+#             各账户收支合计和期初余额；范围读取只打开相交的分区，增删改只重写涉及的分区
+#   excel   - 旧的 financial_records.xlsx，只用于迁移和导出
+# 余额是派生数据，不落盘，读取后统一计算。
+
+COLUMNS = ["序号", "日期", "类型", "账户", "金额", "余额", "来源", "用途", "标签", "备注"]
+STORED_COLUMNS = [c for c in COLUMNS if c != "余额"]
+
+
+def empty_frame():
+    """带全部列的空账本"""
+    return pd.DataFrame(columns=COLUMNS)
+
+
+def file_version(path):
+    """文件的 (大小, 修改时间纳秒)，用于判断数据是否被写过"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def apply_changes(df, added, changed, deleted):
+    """把 新增/修改/删除 三类变更应用到 DataFrame 上（按序号定位记录）"""
+    if deleted:
+        df = df[~df["序号"].isin(deleted)]
+    if changed:
+        df = df.copy()
+        labels = pd.Series(df.index, index=df["序号"])
+        for record_id, data in changed.items():
+            if record_id not in labels.index:
+                continue
+            for col, value in data.items():
+                df.loc[labels[record_id], col] = value
+    if added:
+        new_rows = pd.DataFrame(list(added.values()))
+        df = new_rows if df.empty else pd.concat([df, new_rows], ignore_index=True)
+    return df.reset_index(drop=True)
+
+
+def filter_range(df, start=None, end=None, accounts=None):
+    """按日期范围和账户筛选记录"""
+    if start is not None:
+        df = df[df["日期"] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df["日期"] <= pd.Timestamp(end)]
+    if accounts is not None:
+        df = df[df["账户"].isin(list(accounts))]
+    return df
+
+
+def _to_rows(df):
+    """DataFrame -> 可直接写入 SQLite 的元组列表"""
+    frame = df.reindex(columns=STORED_COLUMNS)
+    frame["日期"] = pd.to_datetime(frame["日期"]).dt.strftime("%Y-%m-%d %H:%M:%S")
+    frame = frame.astype(object).where(frame.notna(), None)
+    return list(frame.itertuples(index=False, name=None))
+
+
+def _to_sql_value(col, value):
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+        return None
+    if col == "日期":
+        return pd.Timestamp(value).strftime("%Y-%m-%d %H:%M:%S")
+    if hasattr(value, "item"):  # numpy 标量
+        return value.item()
+    return value
+
+
+class StorageBackend:
+    """存储后端接口；默认的增量更新通过 读取-修改-整体写回 实现"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def version(self):
+        """存储文件的 (大小, 修改时间)，文件不存在时为 None"""
+        return file_version(self.path)
+
+    def read_all(self):
+        raise NotImplementedError
+
+    def write_all(self, df, seq=0):
+        """整体写入账本，并记录已包含的日志序列号"""
+        raise NotImplementedError
+
+    def read_seq(self):
+        """已写入存储的最后一条日志序列号"""
+        return 0
+
+    def read_range(self, start=None, end=None, accounts=None):
+        """按日期范围和账户读取记录"""
+        return filter_range(self.read_all(), start, end, accounts)
+
+    def apply(self, added, changed, deleted, seq):
+        """按序号增删改记录，并更新日志序列号"""
+        df = self.read_all()
+        self.write_all(apply_changes(df, added, changed, deleted), seq)
+
+
+class SQLiteBackend(StorageBackend):
+    """SQLite 存储：序号为主键，日期、账户+日期 建索引"""
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                序号 INTEGER PRIMARY KEY, 日期 TEXT, 类型 TEXT, 账户 TEXT, 金额 REAL,
+                来源 TEXT, 用途 TEXT, 标签 TEXT, 备注 TEXT
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_records_date ON records (日期)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_records_account_date ON records (账户, 日期)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        return conn
+
+    def _query(self, where="", params=()):
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(STORED_COLUMNS)} FROM records {where} ORDER BY 序号",
+                conn, params=params, parse_dates=["日期"],
+            )
+        return df
+
+    def read_all(self):
+        return self._query()
+
+    def read_range(self, start=None, end=None, accounts=None):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("日期 >= ?")
+            params.append(_to_sql_value("日期", start))
+        if end is not None:
+            clauses.append("日期 <= ?")
+            params.append(_to_sql_value("日期", end))
+        if accounts is not None:
+            accounts = list(accounts)
+            clauses.append(f"账户 IN ({', '.join('?' * len(accounts))})")
+            params.extend(accounts)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(where, params)
+
+    def read_seq(self):
+        if not self.exists():
+            return 0
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _set_seq(conn, seq):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seq', ?)", (str(seq),))
+
+    def write_all(self, df, seq=0):
+        placeholders = ", ".join("?" * len(STORED_COLUMNS))
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM records")
+            conn.executemany(f"INSERT INTO records VALUES ({placeholders})", _to_rows(df))
+            self._set_seq(conn, seq)
+
+    def apply(self, added, changed, deleted, seq):
+        # 同一事务内完成全部单点更新，中途失败不会留下一半的结果
+        placeholders = ", ".join("?" * len(STORED_COLUMNS))
+        with closing(self._connect()) as conn, conn:
+            if deleted:
+                conn.executemany("DELETE FROM records WHERE 序号 = ?", [(int(i),) for i in deleted])
+            for record_id, data in changed.items():
+                cols = [c for c in data if c in STORED_COLUMNS and c != "序号"]
+                if cols:
+                    conn.execute(
+                        f"UPDATE records SET {', '.join(f'{c} = ?' for c in cols)} WHERE 序号 = ?",
+                        [_to_sql_value(c, data[c]) for c in cols] + [int(record_id)],
+                    )
+            if added:
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO records VALUES ({placeholders})",
+                    _to_rows(pd.DataFrame(list(added.values()))),
+                )
+            self._set_seq(conn, seq)
+
+
+def _require_pyarrow(kind):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError(f"{kind} 存储需要安装 pyarrow: pip install pyarrow")
+
+
+def _arrow_table(df):
+    """按 日期/序号 排序、列类型统一后的 Arrow 表"""
+    import pyarrow as pa
+
+    frame = df.reindex(columns=STORED_COLUMNS).sort_values(["日期", "序号"])
+    frame["日期"] = pd.to_datetime(frame["日期"])
+    frame["金额"] = frame["金额"].astype(float)
+    for col in ["类型", "账户", "来源", "用途", "标签", "备注"]:
+        frame[col] = frame[col].astype(object).where(frame[col].notna(), None)
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+class ParquetBackend(StorageBackend):
+    """Parquet 列式存储：按日期排序写入，范围读取时只解码命中的行组"""
+
+    ROW_GROUP_SIZE = 50_000
+    SEQ_KEY = b"jizhang_seq"
+
+    def __init__(self, path):
+        super().__init__(path)
+        _require_pyarrow("Parquet")
+
+    def read_all(self):
+        return pd.read_parquet(self.path).sort_values("序号").reset_index(drop=True)
+
+    def read_range(self, start=None, end=None, accounts=None):
+        filters = []
+        if start is not None:
+            filters.append(("日期", ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append(("日期", "<=", pd.Timestamp(end)))
+        if accounts is not None:
+            filters.append(("账户", "in", list(accounts)))
+        df = pd.read_parquet(self.path, filters=filters or None)
+        return df.sort_values("序号").reset_index(drop=True)
+
+    def read_seq(self):
+        if not self.exists():
+            return 0
+        import pyarrow.parquet as pq
+        metadata = pq.read_schema(self.path).metadata or {}
+        return int(metadata.get(self.SEQ_KEY, b"0"))
+
+    def write_all(self, df, seq=0):
+        import pyarrow.parquet as pq
+
+        table = _arrow_table(df)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), self.SEQ_KEY: str(seq).encode()})
+        tmp_path = self.path + ".tmp"
+        pq.write_table(table, tmp_path, row_group_size=self.ROW_GROUP_SIZE)
+        os.replace(tmp_path, self.path)
+
+
+def _fsync_file(path):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def _period_keys(dates, freq):
+    """日期所属分区的名称（如 2025-07 或 2025）；传入 Series 时保留其索引"""
+    return pd.Series(pd.to_datetime(dates)).dt.to_period(freq).astype(str)
+
+
+class PartitionedBackend(StorageBackend):
+    """按月或按年分区的 Parquet 目录
+
+    每个分区一个文件，manifest.json 记录日志序列号和各分区的元数据：
+    行数、日期范围、序号范围、各账户的收支合计（分）以及分区开始前各账户的余额（期初余额）。
+    写入时先写出新的分区文件，再原子地替换清单，最后删除不再引用的旧文件，
+    中途崩溃时清单仍指向完整的旧分区。
+    """
+
+    MANIFEST = "manifest.json"
+    FREQS = {"M": "月", "Y": "年"}
+
+    def __init__(self, path, freq="M"):
+        super().__init__(path)
+        _require_pyarrow("分区")
+        if freq not in self.FREQS:
+            raise ValueError(f"未知的分区粒度: {freq}（可选: {', '.join(self.FREQS)}）")
+        self.freq = freq
+        self.manifest_path = os.path.join(path, self.MANIFEST)
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def version(self):
+        return file_version(self.manifest_path)
+
+    # ---------- 清单 ----------
+    def read_manifest(self):
+        if not self.exists():
+            return {"seq": 0, "freq": self.freq, "partitions": {}}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def read_seq(self):
+        return self.read_manifest()["seq"]
+
+    def partitions(self):
+        """按时间排序的 (分区名, 元数据)"""
+        return sorted(self.read_manifest()["partitions"].items())
+
+    @staticmethod
+    def _describe(frame, file_name):
+        """分区元数据；金额合计以分为单位，累加没有浮点误差"""
+        fen = (frame["金额"].astype(float) * 100).round().astype("int64")
+        accounts = {}
+        for (account, kind), total in fen.groupby([frame["账户"], frame["类型"]]).sum().items():
+            accounts.setdefault(account, {})[kind] = int(total)
+        return {
+            "file": file_name,
+            "rows": len(frame),
+            "min_date": frame["日期"].min().isoformat(),
+            "max_date": frame["日期"].max().isoformat(),
+            "min_id": int(frame["序号"].min()),
+            "max_id": int(frame["序号"].max()),
+            "accounts": accounts,
+        }
+
+    def _commit(self, manifest):
+        """重算各分区的期初余额，原子地替换清单，再删除不再引用的分区文件"""
+        balances = {}
+        for key in sorted(manifest["partitions"]):
+            part = manifest["partitions"][key]
+            part["opening"] = dict(balances)
+            for account, totals in part["accounts"].items():
+                balances[account] = balances.get(account, 0) + totals.get("收入", 0) - totals.get("支出", 0)
+
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+        referenced = {part["file"] for part in manifest["partitions"].values()}
+        for name in os.listdir(self.path):
+            if name.endswith(".parquet") and name not in referenced:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+    def _write_partition(self, key, frame):
+        import pyarrow.parquet as pq
+
+        # 每次写入新文件，提交清单之前旧文件保持不变
+        file_name = f"{key}-{os.urandom(4).hex()}.parquet"
+        path = os.path.join(self.path, file_name)
+        pq.write_table(_arrow_table(frame), path)
+        _fsync_file(path)
+        return self._describe(frame, file_name)
+
+    # ---------- 读取 ----------
+    def _read_files(self, parts):
+        if not parts:
+            return pd.DataFrame(columns=STORED_COLUMNS)
+        frames = [pd.read_parquet(os.path.join(self.path, part["file"])) for part in parts]
+        return pd.concat(frames, ignore_index=True).sort_values("序号").reset_index(drop=True)
+
+    def _read_selected(self, select):
+        # 读取期间若有合并替换了分区文件，按新的清单重读
+        for _ in range(3):
+            parts = [part for _, part in self.partitions() if select(part)]
+            try:
+                return self._read_files(parts)
+            except FileNotFoundError:
+                continue
+        return self._read_files([part for _, part in self.partitions() if select(part)])
+
+    @staticmethod
+    def _overlaps(part, start, end, accounts=None):
+        if start is not None and pd.Timestamp(part["max_date"]) < pd.Timestamp(start):
+            return False
+        if end is not None and pd.Timestamp(part["min_date"]) > pd.Timestamp(end):
+            return False
+        return accounts is None or any(a in part["accounts"] for a in accounts)
+
+    def read_all(self):
+        return self._read_selected(lambda part: True)
+
+    def read_range(self, start=None, end=None, accounts=None):
+        accounts = list(accounts) if accounts is not None else None
+        df = self._read_selected(lambda part: self._overlaps(part, start, end, accounts))
+        return filter_range(df, start, end, accounts).reset_index(drop=True)
+
+    def read_window(self, start=None, end=None):
+        """读取与日期范围相交的整个分区，返回 (第一个分区的期初余额, 记录)
+
+        期初余额（分）加上分区内的累计金额就是每条记录的余额，不必读取更早的分区。
+        """
+        selected = [part for _, part in self.partitions() if self._overlaps(part, start, end)]
+        if not selected:
+            return {}, pd.DataFrame(columns=STORED_COLUMNS)
+        return dict(selected[0]["opening"]), self._read_selected(lambda part: self._overlaps(part, start, end))
+
+    # ---------- 写入 ----------
+    def write_all(self, df, seq=0):
+        os.makedirs(self.path, exist_ok=True)
+        partitions = {}
+        if not df.empty:
+            for key, frame in df.groupby(_period_keys(df["日期"], self.freq).to_numpy()):
+                partitions[key] = self._write_partition(key, frame)
+        self._commit({"seq": seq, "freq": self.freq, "partitions": partitions})
+
+    def apply(self, added, changed, deleted, seq):
+        """只读取并重写涉及的分区：被改/删记录所在的分区，以及新增或改期记录落入的分区"""
+        os.makedirs(self.path, exist_ok=True)
+        manifest = self.read_manifest()
+        freq, partitions = manifest["freq"], manifest["partitions"]
+
+        touched = set()
+        ids = set(changed) | set(deleted)
+        if ids:
+            lo, hi = min(ids), max(ids)
+            for key, part in partitions.items():
+                if part["max_id"] < lo or part["min_id"] > hi:
+                    continue
+                found = pd.read_parquet(os.path.join(self.path, part["file"]), columns=["序号"])["序号"]
+                if found.isin(ids).any():
+                    touched.add(key)
+        new_dates = [r["日期"] for r in added.values()] + [d["日期"] for d in changed.values() if "日期" in d]
+        if new_dates:
+            touched.update(k for k in _period_keys(new_dates, freq) if k in partitions)
+
+        frame = apply_changes(self._read_files([partitions[k] for k in sorted(touched)]), added, changed, deleted)
+        partitions = {k: part for k, part in partitions.items() if k not in touched}
+        if not frame.empty:
+            for key, group in frame.groupby(_period_keys(frame["日期"], freq).to_numpy()):
+                partitions[key] = self._write_partition(key, group)
+        self._commit({"seq": seq, "freq": freq, "partitions": partitions})
+
+
+class ExcelBackend(StorageBackend):
+    """Excel 账本：保留用于迁移旧数据和导出"""
+
+    def read_all(self):
+        return pd.read_excel(self.path, parse_dates=["日期"])
+
+    def write_all(self, df, seq=0):
+        export_excel(df, self.path)
+
+
+BACKENDS = {
+    "sqlite": SQLiteBackend,
+    "parquet": ParquetBackend,
+    "partitioned": PartitionedBackend,
+    "excel": ExcelBackend,
+}
+
+
+def open_storage(kind, path, **options):
+    """按名称创建存储后端；options 传给后端（如分区粒度 freq）"""
+    if kind not in BACKENDS:
+        raise ValueError(f"未知的存储后端: {kind}（可选: {', '.join(BACKENDS)}）")
+    return BACKENDS[kind](path, **options)
+
+
+EXCEL_MAX_ROWS = 1_048_575  # Excel 工作表行数上限（不含表头）
+
+
+def export_excel(df, path):
+    """导出为与旧版兼容的 Excel 账本
+
+    先写到同目录的临时文件，写完并落盘后再原子地替换旧文件，导出中途崩溃不会留下残缺的工作簿。
+    """
+    columns = COLUMNS if "余额" in df.columns else STORED_COLUMNS
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{ext}"
+    try:
+        df.reindex(columns=columns).to_excel(tmp_path, index=False)
+        _fsync_file(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def migrate_excel(excel_path, store):
+    """一次性把旧的 Excel 账本导入存储后端，返回导入的记录数"""
+    df = pd.read_excel(excel_path, parse_dates=["日期"])
+    store.write_all(df, seq=0)
+    return len(df)
+
+
+if __name__ == "__main__":
+    # 用法: python storage.py financial_records.xlsx sqlite financial_records.db
+    if len(sys.argv) != 4:
+        print("用法: python storage.py <Excel账本> <sqlite|parquet|partitioned> <目标文件或目录>")
+        sys.exit(1)
+    excel_path, kind, target = sys.argv[1:]
+    count = migrate_excel(excel_path, open_storage(kind, target))
+    print(f"已迁移 {count} 条记录到 {target}")
@@ -0,0 +1,99 @@
+import re
+
+import pandas as pd
+
+import ledger_index
+
+# ===================== 标签索引 =====================
+# 标签统一规则：空格、中英文逗号、顿号、分号都视为分隔符，保存时统一成空格分隔。
+# 索引维护 记录 <-> 标签 的关联表（每个 记录×标签 一行，附带日期/类型/账户/金额），
+# 构建一次后随增删改更新，标签统计直接在关联表上做向量化 groupby。
+# 增删只记入待并入的行，查询时在索引锁下一次性并入；并入后的关联表不再原地修改。
+
+TAG_SEPARATORS = re.compile(r"[\s,，、;；]+")
+PAIR_COLUMNS = ["序号", "标签", "日期", "类型", "账户", "金额"]
+
+
+def split_tags(text):
+    """拆分标签文本，去掉空标签和重复标签"""
+    if text is None or (pd.api.types.is_scalar(text) and pd.isna(text)):
+        return []
+    return list(dict.fromkeys(t for t in TAG_SEPARATORS.split(str(text)) if t))
+
+
+def normalize_tags(text):
+    """统一保存为空格分隔的标签"""
+    return " ".join(split_tags(text))
+
+
+class TagIndex:
+    """记录与标签的关联表，以及 标签 -> 序号集合"""
+
+    def __init__(self, df):
+        if df.empty or "标签" not in df.columns:
+            self._pairs = pd.DataFrame(columns=PAIR_COLUMNS)
+        else:
+            tags = df["标签"].fillna("").astype(str).str.split(TAG_SEPARATORS)
+            pairs = df[["序号", "日期", "类型", "账户", "金额"]].assign(标签=tags).explode("标签")
+            pairs = pairs[pairs["标签"].notna() & (pairs["标签"] != "")]
+            pairs = pairs.drop_duplicates(["序号", "标签"])
+            self._pairs = pairs[PAIR_COLUMNS].reset_index(drop=True)
+        self.postings = self._pairs.groupby("标签")["序号"].agg(set).to_dict()
+        self._pending = []     # 尚未并入关联表的新增行
+        self._removed = set()  # 需要从关联表中去掉的序号
+
+    # ---------- 增量维护 ----------
+    def on_add(self, record_id, record):
+        for tag in split_tags(record.get("标签")):
+            self.postings.setdefault(tag, set()).add(record_id)
+            self._pending.append((record_id, tag, pd.Timestamp(record["日期"]),
+                                  record["类型"], record["账户"], record["金额"]))
+
+    def on_remove(self, record_id, record):
+        for tag in split_tags(record.get("标签")):
+            ids = self.postings.get(tag)
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del self.postings[tag]
+        self._removed.add(record_id)
+        self._pending = [row for row in self._pending if row[0] != record_id]
+
+    def pairs(self):
+        """当前的关联表（有变更时才重新拼接）"""
+        with ledger_index.locked():
+            if self._removed or self._pending:
+                pairs = self._pairs
+                if self._removed:
+                    pairs = pairs[~pairs["序号"].isin(self._removed)]
+                if self._pending:
+                    new_rows = pd.DataFrame(self._pending, columns=PAIR_COLUMNS)
+                    pairs = new_rows if pairs.empty else pd.concat([pairs, new_rows], ignore_index=True)
+                self._pairs = pairs.reset_index(drop=True)
+                self._pending, self._removed = [], set()
+            return self._pairs
+
+    # ---------- 查询 ----------
+    def filtered(self, tag_type="全部", accounts=None):
+        """按收支类型和账户筛选后的关联表"""
+        pairs = self.pairs()
+        if tag_type != "全部":
+            pairs = pairs[pairs["类型"] == tag_type]
+        if accounts is not None:
+            pairs = pairs[pairs["账户"].isin(list(accounts))]
+        return pairs
+
+    def stats(self, tag_type="全部", accounts=None, min_count=1):
+        """各标签的金额合计和出现次数，按金额降序"""
+        return (
+            self.filtered(tag_type, accounts)
+            .groupby("标签")["金额"]
+            .agg(["sum", "count"])
+            .query(f"count >= {min_count}")
+            .sort_values("sum", ascending=False)
+        )
+
+    def record_ids(self, tag):
+        """带有该标签的记录序号"""
+        with ledger_index.locked():
+            return set(self.postings.get(tag, ()))
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+# ===================== 趋势分析 =====================
+# 把支出按天汇总成连续的日序列（没有支出的日子补 0），列为合计或各用途/标签。
+# 滚动均值、环比/同比和月末预测都是这张 日 × 分组 宽表上的向量化窗口运算
+# （rolling / resample / shift），不逐条遍历记录，多年的账本也能即时计算。
+# 金额单位为分，由界面换算成元。
+
+ROLLING_WINDOWS = (7, 30)   # 滚动均值的窗口（天）
+FORECAST_WINDOW = 30        # 月末预测使用最近多少天的日均支出
+TOTAL = "合计"
+
+
+def daily_matrix(frame, column=None, accounts=None, end=None):
+    """日 × 分组 的支出宽表（分），日期连续到 end（默认最后一笔支出）
+
+    frame 需要 日期/类型/账户/金额 列（账本或标签关联表）；column 为 None 时只有“合计”一列。
+    """
+    mask = frame["类型"] == "支出"
+    if accounts:
+        mask &= frame["账户"].isin(list(accounts))
+    days = frame["日期"][mask].dt.normalize()
+    amounts = frame["金额"][mask]
+    if column is None:
+        wide = amounts.groupby(days).sum().to_frame(TOTAL)
+    else:
+        wide = amounts.groupby([days, frame[column][mask]], observed=True).sum().unstack(fill_value=0)
+        # 按总支出降序排列各列
+        wide = wide[wide.sum().sort_values(ascending=False).index]
+    if wide.empty:
+        return wide
+    last = wide.index.max() if end is None else max(wide.index.max(), pd.Timestamp(end).normalize())
+    wide = wide.reindex(pd.date_range(wide.index.min(), last, freq="D"), fill_value=0)
+    wide.index.name = "日期"
+    wide.columns.name = None
+    return wide
+
+
+def rolling_spend(daily, windows=ROLLING_WINDOWS):
+    """日支出及其滚动日均值（分）；daily 为连续日序列"""
+    result = pd.DataFrame({"日支出": daily})
+    for window in windows:
+        result[f"{window}日均值"] = daily.rolling(window, min_periods=1).mean()
+    return result
+
+
+def _ratio(current, previous):
+    """变化率；上期为 0 时为 NaN"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (current / previous.where(previous != 0) - 1).astype(float)
+
+
+def period_changes(wide, month, through_day=None):
+    """指定月份各分组的支出与环比、同比变化，每个分组一行
+
+    through_day 不为空时只比较每月 1 日到该日（本月未结束时同口径对比）。
+    """
+    month = pd.Period(month, freq="M")
+    if through_day is not None:
+        wide = wide[wide.index.day <= through_day]
+    monthly = wide.resample("ME").sum()
+    monthly.index = monthly.index.to_period("M")
+    # 补齐缺失的月份，shift 按月对齐
+    months = pd.period_range(min(monthly.index.min(), month - 12), max(monthly.index.max(), month), freq="M")
+    monthly = monthly.reindex(months, fill_value=0)
+    previous, last_year = monthly.shift(1), monthly.shift(12)
+
+    current = monthly.loc[month]
+    result = pd.DataFrame({
+        "本月": current,
+        "上月": previous.loc[month],
+        "去年同月": last_year.loc[month],
+    })
+    result["环比"] = result["本月"] - result["上月"]
+    result["环比%"] = _ratio(result["本月"], result["上月"]) * 100
+    result["同比"] = result["本月"] - result["去年同月"]
+    result["同比%"] = _ratio(result["本月"], result["去年同月"]) * 100
+    return result[(result[["本月", "上月", "去年同月"]] != 0).any(axis=1)]
+
+
+def project_month_end(wide, as_of, window=FORECAST_WINDOW):
+    """月末支出预测（各分组一行）：本月截至 as_of 的支出 + 剩余天数 × 最近 window 天的日均支出
+
+    wide 须连续到 as_of（daily_matrix 的 end 参数）。
+    """
+    as_of = pd.Timestamp(as_of).normalize()
+    month_start = as_of.replace(day=1)
+    remaining = (month_start + pd.offsets.MonthEnd(0) - as_of).days
+    upto = wide.loc[:as_of]
+    spent = upto.loc[month_start:].sum()
+    recent = upto.iloc[-window:].mean()
+    previous = upto.loc[month_start - pd.offsets.MonthBegin(1):month_start - pd.Timedelta(days=1)].sum()
+    result = pd.DataFrame({
+        "本月已支出": spent,
+        f"近{window}日日均": recent,
+        "预计月末": spent + recent * remaining,
+        "上月": previous,
+    })
+    result.attrs["remaining_days"] = remaining
+    return result